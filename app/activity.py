@@ -0,0 +1,83 @@
+"""Write-behind tracking of users' last_active.
+
+Every update records its sender here (a TypeHandler in group -1 runs
+before all other handlers). Timestamps are kept in memory and flushed
+every ACTIVITY_FLUSH_INTERVAL seconds as one unordered bulk_write of
+``$max`` updates, so a busy user costs one write per interval instead of
+one per message, and out-of-order flushes can never move last_active back.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+
+from .models import User
+
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))
+ACTIVITY_GROUP = -1
+
+logger = logging.getLogger(__name__)
+
+_pending: Dict[int, datetime] = {}
+_task: Optional[asyncio.Task] = None
+
+
+def record(telegram_id: int, when: Optional[datetime] = None) -> None:
+    when = when or datetime.utcnow()
+    prev = _pending.get(telegram_id)
+    if prev is None or when > prev:
+        _pending[telegram_id] = when
+
+
+async def flush() -> int:
+    global _pending
+    if not _pending:
+        return 0
+    batch, _pending = _pending, {}
+    ops = [UpdateOne({"telegram_id": tid}, {"$max": {"last_active": ts}}) for tid, ts in batch.items()]
+    try:
+        await User.get_motor_collection().bulk_write(ops, ordered=False)
+    except Exception:
+        logger.exception("last_active flush failed; retrying next interval")
+        for tid, ts in batch.items():
+            record(tid, ts)
+        return 0
+    return len(ops)
+
+
+async def _flush_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await flush()
+
+
+def start(interval: float = ACTIVITY_FLUSH_INTERVAL) -> None:
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_flush_loop(interval))
+
+
+async def stop() -> None:
+    """Stop the flusher and write whatever is still buffered."""
+    global _task
+    task, _task = _task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await flush()
+
+
+async def _record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user:
+        record(update.effective_user.id)
+
+
+activity_handler = TypeHandler(Update, _record_update)
@@ -0,0 +1,519 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+from beanie import PydanticObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from .keyboards import broadcast_controls_keyboard
+from .models import BroadcastJob, SendBudget, User
+
+# Telegram allows ~30 messages/s per bot across all chats; stay under it.
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_MAX_ATTEMPTS = 4
+PROGRESS_INTERVAL = 3.0
+# Failed recipient ids kept on a job; the failed count covers the rest.
+FAILED_IDS_SAMPLE = 1000
+# A running job whose owner has not checkpointed for this long is taken over.
+BROADCAST_JOB_TTL = float(os.getenv("BROADCAST_JOB_TTL", "30"))
+# How often watch_jobs looks for running jobs nobody here runs yet.
+BROADCAST_JOB_POLL_INTERVAL = float(os.getenv("BROADCAST_JOB_POLL_INTERVAL", "5"))
+
+logger = logging.getLogger(__name__)
+
+SendFn = Callable[[int], Awaitable[object]]
+SendTextFn = Callable[[int, str], Awaitable[object]]
+ProgressFn = Callable[["BroadcastStats"], Awaitable[None]]
+CheckpointFn = Callable[["BroadcastStats"], Awaitable[bool]]
+
+
+class RateLimiter:
+    """Global send pacing shared by all workers of a broadcast.
+
+    Slots are handed out ``1/rate`` seconds apart. A RetryAfter from Telegram
+    pushes the next slot back for everyone, since the flood limit is per bot.
+    """
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            wait = self._next - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                now = loop.time()
+            self._next = max(now, self._next) + self._interval
+
+    async def backoff(self, seconds: float) -> None:
+        self._next = max(self._next, asyncio.get_running_loop().time() + seconds)
+
+
+class MongoRateLimiter:
+    """RateLimiter whose slots come from one ``rate_limits`` document, so
+    every process sending as the bot (web workers, bot workers, an old and
+    a new leader) shares its budget.
+
+    Each acquire reserves the next slot with a single atomic update and then
+    sleeps until it. Slots are wall-clock times, so hosts need synced clocks.
+    """
+
+    def __init__(self, rate: float, name: str = "telegram"):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self.name = name
+
+    async def _update(self, update) -> dict:
+        coll = SendBudget.get_motor_collection()
+        try:
+            return await coll.find_one_and_update(
+                {"name": self.name}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another process created the document first; it exists now.
+            return await coll.find_one_and_update({"name": self.name}, update, return_document=ReturnDocument.AFTER)
+
+    async def acquire(self) -> None:
+        if not self._interval:
+            return
+        doc = await self._update(
+            [{"$set": {"next_at": {"$add": [{"$max": ["$next_at", time.time()]}, self._interval]}}}]
+        )
+        wait = doc["next_at"] - self._interval - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def backoff(self, seconds: float) -> None:
+        await self._update({"$max": {"next_at": time.time() + seconds}})
+
+
+Limiter = Union[RateLimiter, MongoRateLimiter]
+
+# Telegram's limit is per bot, so every process draws from the same budget.
+shared_limiter = MongoRateLimiter(BROADCAST_RATE)
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    failures: Counter = field(default_factory=Counter)
+    failed_ids: List[int] = field(default_factory=list)
+    # Highest recipient id such that it and every id before it are finished.
+    watermark: int = 0
+    stopped: bool = False
+
+    @property
+    def remaining(self) -> int:
+        return max(self.total - self.sent - self.failed, 0)
+
+
+def _failure_reason(exc: Exception) -> str:
+    if isinstance(exc, Forbidden):
+        return "blocked"
+    if isinstance(exc, BadRequest):
+        return "bad_request"
+    if isinstance(exc, (TimedOut, NetworkError)):
+        return "network"
+    return type(exc).__name__
+
+
+async def send_with_retry(send: SendFn, chat_id: int, limiter: Limiter) -> Optional[str]:
+    """Deliver one message. Returns None on success or a failure reason."""
+    for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+        await limiter.acquire()
+        try:
+            await send(chat_id)
+            return None
+        except RetryAfter as e:
+            logger.warning("Broadcast throttled, retrying after %ss", e.retry_after)
+            await limiter.backoff(float(e.retry_after))
+            reason = "flood_limit"
+        except BadRequest as e:
+            # BadRequest subclasses NetworkError but retrying cannot help.
+            return _failure_reason(e)
+        except (TimedOut, NetworkError) as e:
+            await asyncio.sleep(min(2 ** attempt, 30))
+            reason = _failure_reason(e)
+        except Exception as e:
+            return _failure_reason(e)
+    return reason
+
+
+async def iter_recipients(after: int = 0) -> AsyncIterator[int]:
+    """Stream recipient ids from Mongo instead of loading every user."""
+    cursor = (
+        User.get_motor_collection()
+        .find({"telegram_id": {"$gt": after}}, {"_id": 0, "telegram_id": 1})
+        .sort("telegram_id", 1)
+    )
+    async for doc in cursor:
+        yield doc["telegram_id"]
+
+
+async def count_recipients(after: int = 0) -> int:
+    return await User.get_motor_collection().count_documents({"telegram_id": {"$gt": after}})
+
+
+async def run_broadcast(
+    send: SendFn,
+    recipients: AsyncIterator[int],
+    stats: BroadcastStats,
+    on_progress: Optional[ProgressFn] = None,
+    on_checkpoint: Optional[CheckpointFn] = None,
+    stop: Optional[asyncio.Event] = None,
+    concurrency: int = BROADCAST_CONCURRENCY,
+    limiter: Limiter = shared_limiter,
+) -> BroadcastStats:
+    """Send to every recipient (ascending ids) through a bounded worker pool.
+
+    ``on_checkpoint`` is called every PROGRESS_INTERVAL with the current
+    watermark; returning False stops the run, as does setting ``stop``.
+    In-flight sends always finish before this returns.
+    """
+    stop = stop or asyncio.Event()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    inflight: Deque[List] = deque()  # [chat_id, done] in dispatch order
+
+    def finish(entry: List) -> None:
+        entry[1] = True
+        while inflight and inflight[0][1]:
+            stats.watermark = inflight.popleft()[0]
+
+    async def worker():
+        while True:
+            entry = await queue.get()
+            try:
+                if entry is None:
+                    return
+                chat_id = entry[0]
+                reason = await send_with_retry(send, chat_id, limiter)
+                if reason is None:
+                    stats.sent += 1
+                else:
+                    stats.failed += 1
+                    stats.failures[reason] += 1
+                    if len(stats.failed_ids) < FAILED_IDS_SAMPLE:
+                        stats.failed_ids.append(chat_id)
+                finish(entry)
+            finally:
+                queue.task_done()
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                if on_checkpoint and not await on_checkpoint(stats):
+                    stop.set()
+                if on_progress:
+                    await on_progress(stats)
+            except Exception:
+                logger.debug("Broadcast progress update failed", exc_info=True)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(concurrency, 1))]
+    progress = asyncio.create_task(reporter()) if (on_progress or on_checkpoint) else None
+    try:
+        async for chat_id in recipients:
+            if stop.is_set():
+                stats.stopped = True
+                break
+            entry = [chat_id, False]
+            inflight.append(entry)
+            await queue.put(entry)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+        if progress:
+            progress.cancel()
+    if not stats.stopped:
+        # A recipient count taken at start can drift while the job runs.
+        stats.total = stats.sent + stats.failed
+    return stats
+
+
+# ---------- Persisted jobs ----------
+# Job state lives in Mongo (broadcast_jobs). A job is resumed after a restart
+# from its watermark; at most the sends that were in flight at the last
+# checkpoint (queue + workers) can be repeated.
+#
+# Several processes may try to run the same job (bot and web app, a new
+# leader while the old one is still draining). Each run first claims the job
+# by setting ``owner``; every write of a run is conditional on still owning
+# it, so a run that lost the job stops at its next checkpoint.
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_stops: Dict[PydanticObjectId, asyncio.Event] = {}
+_tasks: Dict[PydanticObjectId, asyncio.Task] = {}
+# Set while stop_jobs drains this process's runs; no new run may start.
+_halting = False
+
+
+def _claimable(now: datetime) -> dict:
+    return {
+        "$or": [
+            {"owner": None},
+            {"owner": _OWNER},
+            {"heartbeat_at": {"$lt": now - timedelta(seconds=BROADCAST_JOB_TTL)}},
+        ]
+    }
+
+
+async def _claim(job_id: PydanticObjectId) -> Optional[BroadcastJob]:
+    """Take a running job for this process; None if it is not running or
+    another process holds it."""
+    now = datetime.utcnow()
+    doc = await BroadcastJob.get_motor_collection().find_one_and_update(
+        {"_id": job_id, "status": "running", **_claimable(now)},
+        {"$set": {"owner": _OWNER, "heartbeat_at": now}},
+        return_document=ReturnDocument.AFTER,
+    )
+    return BroadcastJob.parse_obj(doc) if doc else None
+
+
+async def _release(job_id: PydanticObjectId) -> None:
+    await BroadcastJob.get_motor_collection().update_one(
+        {"_id": job_id, "owner": _OWNER}, {"$set": {"owner": None, "heartbeat_at": None}}
+    )
+
+
+async def _save_progress(job_id: PydanticObjectId, stats: BroadcastStats, persisted: List[int], only_running: bool) -> bool:
+    new_failed = stats.failed_ids[persisted[0]:]
+    now = datetime.utcnow()
+    query = {"_id": job_id, "owner": _OWNER}
+    if only_running:
+        query["status"] = "running"
+    update = {
+        "$set": {
+            "last_telegram_id": stats.watermark,
+            "sent": stats.sent,
+            "failed": stats.failed,
+            "failures": dict(stats.failures),
+            "updated_at": now,
+            "heartbeat_at": now,
+        }
+    }
+    if new_failed:
+        # Capped, so a job failing for most of a large audience stays far
+        # below the 16 MB document limit.
+        update["$push"] = {"failed_ids": {"$each": new_failed, "$slice": FAILED_IDS_SAMPLE}}
+    res = await BroadcastJob.get_motor_collection().update_one(query, update)
+    if res.matched_count:
+        persisted[0] += len(new_failed)
+    return res.matched_count == 1
+
+
+async def _claim_when_free(job_id: PydanticObjectId) -> Optional[BroadcastJob]:
+    """Claim the job, waiting out another owner's heartbeat; None once the
+    job is no longer running."""
+    while True:
+        job = await _claim(job_id)
+        if job is not None:
+            return job
+        current = await BroadcastJob.get(job_id)
+        if current is None or current.status != "running":
+            return None
+        await asyncio.sleep(BROADCAST_JOB_TTL / 3)
+
+
+async def _run_job(job_id: PydanticObjectId, send_text: SendTextFn, bot=None) -> None:
+    stop = _stops[job_id]
+    persisted = [0]
+    try:
+        # The claimed copy, not the caller's, has the latest watermark.
+        job = await _claim_when_free(job_id)
+    except Exception:
+        logger.exception("Claiming broadcast job %s failed", job_id)
+        job = None
+    if job is None:
+        _stops.pop(job_id, None)
+        _tasks.pop(job_id, None)
+        return
+    stats = BroadcastStats(
+        sent=job.sent,
+        failed=job.failed,
+        failures=Counter(job.failures),
+        watermark=job.last_telegram_id,
+    )
+    stats.total = stats.sent + stats.failed + await count_recipients(job.last_telegram_id)
+
+    async def send(chat_id: int):
+        await send_text(chat_id, job.text)
+
+    async def checkpoint(s: BroadcastStats) -> bool:
+        # A pause/cancel from any process flips the status; stop on mismatch.
+        return await _save_progress(job_id, s, persisted, only_running=True)
+
+    async def show(text: str, status: str):
+        if bot and job.admin_chat_id and job.progress_message_id:
+            await bot.edit_message_text(
+                chat_id=job.admin_chat_id,
+                message_id=job.progress_message_id,
+                text=text,
+                reply_markup=broadcast_controls_keyboard(str(job_id), status),
+            )
+
+    async def on_progress(s: BroadcastStats):
+        await show(progress_text(s), "running")
+
+    try:
+        await run_broadcast(
+            send, iter_recipients(job.last_telegram_id), stats, on_progress, checkpoint, stop
+        )
+        await _save_progress(job_id, stats, persisted, only_running=False)
+        if not stats.stopped:
+            await BroadcastJob.get_motor_collection().update_one(
+                {"_id": job_id, "status": "running", "owner": _OWNER}, {"$set": {"status": "done"}}
+            )
+        current = await BroadcastJob.get(job_id)
+        status = current.status if current else "done"
+        try:
+            await show(progress_text(stats, done=status == "done", status=status), status)
+        except Exception:
+            logger.debug("Broadcast final progress update failed", exc_info=True)
+    except Exception:
+        current = None
+        logger.exception("Broadcast job %s failed; it stays resumable", job_id)
+    finally:
+        _stops.pop(job_id, None)
+        _tasks.pop(job_id, None)
+        try:
+            await _release(job_id)
+        except Exception:
+            logger.warning("Releasing broadcast job %s failed", job_id, exc_info=True)
+    if current and current.status == "running" and stats.stopped:
+        # Resumed while the paused run was still draining its workers.
+        start_job(current, send_text, bot)
+
+
+def bot_sender(bot) -> SendTextFn:
+    async def send_text(chat_id: int, text: str):
+        await bot.send_message(chat_id=chat_id, text=text)
+
+    return send_text
+
+
+def start_job(job: BroadcastJob, send_text: SendTextFn, bot=None) -> bool:
+    """Run a persisted job in the background once this process can claim
+    it. No-op if it already runs (or waits) here."""
+    if _halting or job.id in _tasks:
+        return False
+    _stops[job.id] = asyncio.Event()
+    _tasks[job.id] = asyncio.get_running_loop().create_task(_run_job(job.id, send_text, bot))
+    return True
+
+
+async def resume_jobs(send_text: SendTextFn, bot=None, source: Optional[str] = None) -> int:
+    """Pick up running jobs of ``source``. Jobs another live process still
+    owns are waited for and taken over only if its heartbeat goes stale."""
+    query = {"status": "running"}
+    if source:
+        query["source"] = source
+    resumed = 0
+    async for job in BroadcastJob.find(query):
+        if start_job(job, send_text, bot):
+            resumed += 1
+    if resumed:
+        logger.info("Resuming %s broadcast job(s)", resumed)
+    return resumed
+
+
+async def watch_jobs(
+    send_text: SendTextFn, bot=None, source: Optional[str] = None, interval: float = BROADCAST_JOB_POLL_INTERVAL
+) -> None:
+    """resume_jobs now and then every ``interval`` seconds. With leader
+    election the web workers only insert jobs; the lease holder runs this
+    and picks them up."""
+    while True:
+        try:
+            await resume_jobs(send_text, bot, source)
+        except Exception:
+            logger.exception("Looking for broadcast jobs failed")
+        await asyncio.sleep(interval)
+
+
+async def stop_jobs() -> None:
+    """Stop every run in this process and wait until their claims are
+    released; the jobs stay running for the next owner to resume."""
+    global _halting
+    _halting = True
+    try:
+        for stop in list(_stops.values()):
+            stop.set()
+        await asyncio.gather(*list(_tasks.values()), return_exceptions=True)
+    finally:
+        _halting = False
+
+
+async def set_progress_message(job_id: PydanticObjectId, chat_id: int, message_id: int) -> None:
+    """Point the job's live progress display at a message. Only these two
+    fields: a run may be writing its counters at the same time."""
+    await BroadcastJob.get_motor_collection().update_one(
+        {"_id": job_id}, {"$set": {"admin_chat_id": chat_id, "progress_message_id": message_id}}
+    )
+
+
+async def set_job_status(job_id: PydanticObjectId, status: str) -> Optional[BroadcastJob]:
+    """Pause / cancel / resume a job. Returns the job if the change applied."""
+    allowed_from = {
+        "paused": ["running"],
+        "cancelled": ["running", "paused"],
+        "running": ["paused"],
+    }[status]
+    res = await BroadcastJob.get_motor_collection().update_one(
+        {"_id": job_id, "status": {"$in": allowed_from}},
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}},
+    )
+    if not res.matched_count:
+        return None
+    if status != "running" and job_id in _stops:
+        _stops[job_id].set()
+    return await BroadcastJob.get(job_id)
+
+
+FAILURE_LABELS = {
+    "blocked": "حظر البوت أو حذف الحساب",
+    "bad_request": "محادثة غير موجودة",
+    "network": "خطأ في الشبكة",
+    "flood_limit": "تجاوز حد الإرسال",
+}
+
+
+STATUS_LABELS = {
+    "running": "📢 **جاري البث...**",
+    "paused": "⏸ **البث متوقف مؤقتاً**",
+    "cancelled": "🛑 **تم إلغاء البث**",
+    "done": "✅ **اكتمل البث**",
+}
+
+
+def progress_text(stats: BroadcastStats, done: bool = False, status: Optional[str] = None) -> str:
+    head = STATUS_LABELS[status or ("done" if done else "running")]
+    text = (
+        f"{head}\n\n"
+        f"✉️ تم الإرسال: {stats.sent}\n"
+        f"❌ فشل: {stats.failed}\n"
+    )
+    if not done:
+        text += f"⏳ المتبقي: {stats.remaining}\n"
+    if done and stats.failures:
+        text += "\n📋 أسباب الفشل:\n" + "\n".join(
+            f"• {FAILURE_LABELS.get(reason, reason)}: {count}" for reason, count in stats.failures.most_common()
+        )
+    return text
@@ -0,0 +1,68 @@
+"""Small async key/value caches.
+
+Callers talk to the ``CacheStore`` interface only, so the in-process
+``TTLCache`` can later be swapped for a shared store (e.g. Redis) when the
+bot runs as several instances, without touching the call sites.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Protocol, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class CacheStore(Protocol[V]):
+    async def get(self, key: Hashable) -> Optional[V]: ...
+
+    async def set(self, key: Hashable, value: V) -> None: ...
+
+    async def delete(self, key: Hashable) -> None: ...
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU whose entries also expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    async def set(self, key: Hashable, value: V) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+def env_cache(prefix: str, maxsize: int, ttl: float) -> TTLCache[Any]:
+    """TTLCache sized from ``<prefix>_SIZE`` / ``<prefix>_TTL`` env vars."""
+    return TTLCache(
+        maxsize=int(os.getenv(f"{prefix}_SIZE", str(maxsize))),
+        ttl=float(os.getenv(f"{prefix}_TTL", str(ttl))),
+    )
@@ -395,6 +395,34 @@ MATERIALS_BY_YEAR = {
 }
 
 
+YEAR_NAMES = {
+    3: "السنة الثالثة",
+    4: "السنة الرابعة (ذكاء)",
+    5: "السنة الخامسة (ذكاء)",
+}
+
+
+# معرّفات قديمة استخدمها موقع الويب -> المعرف الموحد
+MATERIAL_ALIASES = {
+    "y3_s1_algo_ds": "year3_sem1_algorithms",
+    "y3_s1_os1": "year3_sem1_os",
+    "y3_s1_computing": "year3_sem1_computing",
+    "y3_s2_complexity": "year3_sem2_complexity",
+    "y3_s2_ai_principles": "year3_sem2_ai_principles",
+    "y3_s2_se1": "year3_sem2_software_eng1",
+    "y3_s2_comp_arch1": "year3_sem2_computer_arch",
+    "y4_s1_multimedia": "year4_sem1_multimedia",
+    "y4_s1_concurrent": "year4_sem1_concurrent",
+    "y4_s1_nn": "year4_sem1_neural_networks",
+    "y4_s1_smart_search": "year4_sem1_smart_search",
+    "y4_s2_compilers": "year4_sem2_compilers",
+    "y4_s2_cv": "year4_sem2_computer_vision",
+    "y5_s1_prob_logic": "year5_sem1_probabilistic_logic",
+    "y5_s2_nlp": "year5_sem2_nlp",
+    "y5_s2_kd": "year5_sem2_knowledge_discovery",
+}
+
+
 def get_material(material_id: str):
     """Get material by ID"""
     return MATERIALS.get(material_id)
@@ -0,0 +1,99 @@
+"""Per-update callback context with a coalescing User loader.
+
+PTB builds one context per update and hands it to every handler that runs
+for it, so anything cached on the context lives exactly as long as the
+update. ``context.users.load(id)`` queues the id and resolves all ids
+queued in the same event-loop tick with a single ``$in`` query; later
+loads of the same id in that update are served from memory.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from beanie.operators import In
+from telegram import Update
+from telegram.ext import CallbackContext, ExtBot, TypeHandler
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserLoader:
+    def __init__(self):
+        self._futures: Dict[int, "asyncio.Future[Optional[User]]"] = {}
+        self._queued: List[int] = []
+        self._tasks = set()
+        self.lookups = 0
+        self.round_trips = 0
+
+    def load(self, telegram_id: int) -> "asyncio.Future[Optional[User]]":
+        self.lookups += 1
+        fut = self._futures.get(telegram_id)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._futures[telegram_id] = fut
+            if not self._queued:
+                loop.call_soon(self._dispatch)
+            self._queued.append(telegram_id)
+        return fut
+
+    async def load_many(self, telegram_ids: Iterable[int]) -> List[Optional[User]]:
+        return list(await asyncio.gather(*(self.load(tid) for tid in telegram_ids)))
+
+    def prime(self, user: User) -> None:
+        """Remember a user created or modified during this update."""
+        fut = self._futures.get(user.telegram_id)
+        if fut is not None and not fut.done():
+            # A load() is waiting on it; the fetch then leaves it alone.
+            fut.set_result(user)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_result(user)
+        self._futures[user.telegram_id] = fut
+
+    def _dispatch(self) -> None:
+        ids, self._queued = self._queued, []
+        task = asyncio.create_task(self._fetch(ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, ids: List[int]) -> None:
+        self.round_trips += 1
+        try:
+            docs = await User.find(In(User.telegram_id, ids)).to_list()
+        except Exception as e:
+            for tid in ids:
+                fut = self._futures.get(tid)
+                if fut is not None and not fut.done():
+                    del self._futures[tid]
+                    fut.set_exception(e)
+            return
+        found = {d.telegram_id: d for d in docs}
+        for tid in ids:
+            fut = self._futures[tid]
+            if not fut.done():
+                fut.set_result(found.get(tid))
+
+
+class BotContext(CallbackContext[ExtBot, dict, dict, dict]):
+    @property
+    def users(self) -> UserLoader:
+        loader = getattr(self, "_user_loader", None)
+        if loader is None:
+            loader = self._user_loader = UserLoader()
+        return loader
+
+
+async def _log_lookups(update: Update, context: BotContext) -> None:
+    loader = getattr(context, "_user_loader", None)
+    if loader is not None and loader.lookups:
+        logger.debug(
+            "update %s: %s user lookups, %s round-trips", update.update_id, loader.lookups, loader.round_trips
+        )
+
+
+# Registered in the last handler group so it runs after everything else.
+LOOKUP_STATS_GROUP = 100
+lookup_stats_handler = TypeHandler(Update, _log_lookups)
@@ -1,10 +1,18 @@
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-from .models import User
-from typing import Dict, Any
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from .models import User, BroadcastJob, Enrollment, Lease, Notification, QueuedUpdate, SeenUpdate, SendBudget
+from .enrollments import migrate_embedded_enrollments
+from .notifications import migrate_embedded_notifications
+from .migrations import dedupe_users, run_once
+from typing import Dict, Any, Iterator, List, Tuple
 
 _client = None
 
+logger = logging.getLogger(__name__)
+
 
 async def init_db(mongo_url: str, db_name: str):
     global _client
@@ -34,8 +42,84 @@ async def init_db(mongo_url: str, db_name: str):
         _client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=30000, **retry_kwargs)
         await _client.admin.command("ping")
 
-    await init_beanie(database=_client[db_name], document_models=[User])
+    db = _client[db_name]
+    # Before init_beanie, which builds the unique telegram_id index.
+    await run_once(db, "dedupe_users", lambda: dedupe_users(db))
+    await init_beanie(
+        database=db,
+        document_models=[User, BroadcastJob, Enrollment, Notification, Lease, QueuedUpdate, SeenUpdate, SendBudget],
+    )
+    # Must run before any User.save(): saves replace the whole document and
+    # would drop embedded data that has not been moved yet.
+    await run_once(db, "embedded_notifications", migrate_embedded_notifications)
+    await run_once(db, "embedded_enrollments", migrate_embedded_enrollments)
+    await _drop_retired_indexes()
+    await index_report()
+
+
+# Indexes superseded by wider ones; init_beanie only creates indexes.
+_RETIRED_INDEXES = [(Enrollment, "status_created")]
+
+
+async def _drop_retired_indexes() -> None:
+    for model, name in _RETIRED_INDEXES:
+        try:
+            await model.get_motor_collection().drop_index(name)
+        except OperationFailure:
+            pass  # already gone
 
 
 def get_client() -> AsyncIOMotorClient:
     return _client
+
+
+def _hot_queries() -> List[Tuple[str, Any]]:
+    """The lookups handlers run on every update, as explainable cursors."""
+    users = User.get_motor_collection()
+    enrollments = Enrollment.get_motor_collection()
+    return [
+        ("user by telegram_id", users.find({"telegram_id": 0})),
+        ("broadcast recipients", users.find({"telegram_id": {"$gt": 0}}).sort("telegram_id", ASCENDING)),
+        ("enrollment by student+course", enrollments.find({"telegram_id": 0, "course_id": ""})),
+        ("enrollments of student", enrollments.find({"telegram_id": 0})),
+        (
+            "pending enrollments page",
+            enrollments.find({"approval_status": "pending"}).sort(
+                [("created_at", ASCENDING), ("telegram_id", ASCENDING), ("course_id", ASCENDING)]
+            ),
+        ),
+        ("notifications of student", Notification.get_motor_collection().find({"student_id": 0})),
+        ("broadcast jobs by status", BroadcastJob.get_motor_collection().find({"status": "running"})),
+    ]
+
+
+def _plan_stages(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def index_report() -> List[str]:
+    """Explain each hot query and warn about any that would scan a collection.
+
+    Returns the names of the offending queries (empty when all are indexed).
+    """
+    unindexed = []
+    for name, cursor in _hot_queries():
+        try:
+            explained = await cursor.explain()
+        except Exception as e:
+            logger.warning("Index check skipped for %s: %s", name, e)
+            continue
+        winning = explained.get("queryPlanner", {}).get("winningPlan", {})
+        # Slot-based engine nests the classic tree under "queryPlan".
+        stages = list(_plan_stages(winning.get("queryPlan", winning)))
+        indexes = sorted({st["indexName"] for st in stages if "indexName" in st})
+        if any(st.get("stage") == "COLLSCAN" for st in stages):
+            unindexed.append(name)
+            logger.warning("Query without index: %s (COLLSCAN)", name)
+        else:
+            logger.info("Query %s uses index %s", name, ", ".join(indexes) or "-")
+    return unindexed
@@ -0,0 +1,168 @@
+"""Drop repeated webhook deliveries by update_id.
+
+Telegram redelivers an update when the webhook answers slowly or not at
+all (e.g. during a restart), and PTB would process it again: a second
+admin notification, a receipt recorded twice. Accepted ids are kept in a
+bounded in-memory window; with several instances they are also recorded
+in the ``seen_updates`` collection, whose unique index lets one instance
+claim an update and whose TTL index expires the records after the same
+window.
+
+An id only counts as seen once its update has been accepted. A
+redelivery that arrives while the first delivery is still being accepted
+waits for it and gets the same answer, so it is never acknowledged ahead
+of an update that then fails.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from .config import str_to_bool
+from .leader import LEADER_ELECTION
+from .models import UPDATE_DEDUP_WINDOW, SeenUpdate
+
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", "10000"))
+UPDATE_DEDUP_MONGO = str_to_bool(os.getenv("UPDATE_DEDUP_MONGO", str(LEADER_ELECTION)))
+# How long a redelivery waits for another instance's acceptance before
+# answering 503, and when an unconfirmed claim is considered abandoned.
+CLAIM_WAIT = 10.0
+CLAIM_STALE = 60.0
+
+logger = logging.getLogger(__name__)
+
+_CLAIMED, _ACCEPTED, _BUSY = "claimed", "accepted", "busy"
+
+
+class UpdateDeduplicator:
+    def __init__(
+        self,
+        window: float = UPDATE_DEDUP_WINDOW,
+        maxsize: int = UPDATE_DEDUP_SIZE,
+        use_mongo: bool = UPDATE_DEDUP_MONGO,
+    ):
+        self.window = window
+        self.maxsize = maxsize
+        self.use_mongo = use_mongo
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        # update_id -> outcome of the acceptance still in progress
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.dropped = 0
+
+    def _seen_locally(self, update_id: int) -> bool:
+        now = time.monotonic()
+        while self._seen:
+            oldest, ts = next(iter(self._seen.items()))
+            if now - ts <= self.window and len(self._seen) <= self.maxsize:
+                break
+            del self._seen[oldest]
+        return update_id in self._seen
+
+    def _drop(self, update_id: int) -> None:
+        self.dropped += 1
+        logger.debug("Dropped repeated update %s (%s so far)", update_id, self.dropped)
+
+    async def accept(self, update_id: Optional[int], accept: Callable[[], Awaitable[bool]]) -> bool:
+        """Run ``accept`` for an update unless it was already accepted.
+
+        Returns whether the update is safely accepted, i.e. whether the
+        webhook may answer 200.
+        """
+        if update_id is None:
+            return await accept()
+        pending = self._inflight.get(update_id)
+        if pending is not None:
+            self._drop(update_id)
+            return await asyncio.shield(pending)
+        outcome = asyncio.get_running_loop().create_future()
+        self._inflight[update_id] = outcome
+        ok = False
+        try:
+            ok = await self._accept_once(update_id, accept)
+        finally:
+            del self._inflight[update_id]
+            outcome.set_result(ok)
+        return ok
+
+    async def _accept_once(self, update_id: int, accept: Callable[[], Awaitable[bool]]) -> bool:
+        if self._seen_locally(update_id):
+            self._drop(update_id)
+            return True
+        claim = await self._claim(update_id) if self.use_mongo else _CLAIMED
+        if claim == _ACCEPTED:
+            self._seen[update_id] = time.monotonic()
+            self._drop(update_id)
+            return True
+        if claim == _BUSY:
+            return False
+        try:
+            ok = await accept()
+        except BaseException:
+            await self._release(update_id)
+            raise
+        if ok:
+            self._seen[update_id] = time.monotonic()
+            await self._confirm(update_id)
+        else:
+            await self._release(update_id)
+        return ok
+
+    async def _claim(self, update_id: int) -> str:
+        """Claim ``update_id`` across instances, waiting out another
+        instance's acceptance in progress."""
+        collection = SeenUpdate.get_motor_collection()
+        deadline = time.monotonic() + CLAIM_WAIT
+        try:
+            while True:
+                try:
+                    await SeenUpdate(update_id=update_id, accepted=False).insert()
+                    return _CLAIMED
+                except DuplicateKeyError:
+                    pass
+                doc = await collection.find_one({"update_id": update_id})
+                if doc is None:
+                    continue  # released meanwhile; try again
+                if doc.get("accepted", True):
+                    return _ACCEPTED
+                if doc["seen_at"] < datetime.utcnow() - timedelta(seconds=CLAIM_STALE):
+                    taken = await collection.find_one_and_update(
+                        {"_id": doc["_id"], "seen_at": doc["seen_at"]}, {"$set": {"seen_at": datetime.utcnow()}}
+                    )
+                    if taken:
+                        return _CLAIMED
+                    continue
+                if time.monotonic() >= deadline:
+                    return _BUSY
+                await asyncio.sleep(0.05)
+        except Exception:
+            # The local window still applies; better a rare repeat than
+            # rejecting updates while Mongo is unreachable.
+            logger.warning("seen_updates claim failed for %s", update_id, exc_info=True)
+            return _CLAIMED
+
+    async def _confirm(self, update_id: int) -> None:
+        if not self.use_mongo:
+            return
+        try:
+            await SeenUpdate.get_motor_collection().update_one(
+                {"update_id": update_id}, {"$set": {"accepted": True}}
+            )
+        except Exception:
+            logger.warning("seen_updates confirm failed for %s", update_id, exc_info=True)
+
+    async def _release(self, update_id: int) -> None:
+        """Let a redelivery of a rejected update be accepted."""
+        if not self.use_mongo:
+            return
+        try:
+            await SeenUpdate.get_motor_collection().delete_one({"update_id": update_id, "accepted": False})
+        except Exception:
+            logger.warning("seen_updates release failed for %s", update_id, exc_info=True)
+
+
+deduplicator = UpdateDeduplicator()
@@ -0,0 +1,164 @@
+"""Enrollment reads and field-level writes.
+
+Enrollments live in their own collection, one document per (student,
+course), so every question the bot asks is one lookup on a compound
+index: a student's status for a course, a student's list, or the pending
+queue in age order. Writes are single upserts or ``$set``s that touch
+only the fields they change, so concurrent writers cannot lose each
+other's updates.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from .cache import CacheStore, env_cache
+from .migrations import bulk_upsert
+from .models import Enrollment, User
+
+MIGRATION_BATCH = 200
+
+# telegram_id -> {course_id: approval_status}. Statuses change only through
+# the writers below, which invalidate; the TTL bounds staleness from writes
+# made by another process.
+status_cache: CacheStore[Dict[str, str]] = env_cache("ENROLLMENT_CACHE", maxsize=10000, ttl=300)
+# Bumped by every invalidation; a load that overlapped one is not cached.
+_write_epoch = 0
+
+logger = logging.getLogger(__name__)
+
+
+async def upsert_enrollment(
+    telegram_id: int,
+    course_id: str,
+    method: str,
+    status: str = "pending",
+    receipt: Optional[str] = None,
+) -> None:
+    """Update the student's enrollment for ``course_id`` or create it.
+
+    ``receipt`` is only written when given, so approving from the web keeps
+    a receipt submitted through the bot.
+    """
+    now = datetime.utcnow()
+    fields: Dict[str, Any] = {"payment_method": method, "approval_status": status, "updated_at": now}
+    if receipt is not None:
+        fields["payment_receipt"] = receipt
+    update = {"$set": fields, "$setOnInsert": {"created_at": now}}
+    key = {"telegram_id": telegram_id, "course_id": course_id}
+    try:
+        await Enrollment.get_motor_collection().update_one(key, update, upsert=True)
+    except DuplicateKeyError:
+        # Two upserts raced to insert; the loser now matches the winner's row.
+        await Enrollment.get_motor_collection().update_one(key, update)
+    await invalidate_status(telegram_id)
+
+
+async def submit_payment(telegram_id: int, course_ids: Iterable[str], method: str, receipt: Optional[str]) -> None:
+    """Record a receipt for each course and put it back to pending."""
+    for course_id in course_ids:
+        await upsert_enrollment(telegram_id, course_id, method, "pending", receipt)
+
+
+async def set_approval(telegram_id: int, course_id: str, status: str) -> Optional[Dict[str, Any]]:
+    """Set one enrollment's status.
+
+    Returns ``{"telegram_id", "full_name"}`` of the student, or None when the
+    student has no enrollment for ``course_id``.
+    """
+    res = await Enrollment.get_motor_collection().update_one(
+        {"telegram_id": telegram_id, "course_id": course_id},
+        {"$set": {"approval_status": status, "updated_at": datetime.utcnow()}},
+    )
+    if not res.matched_count:
+        return None
+    await invalidate_status(telegram_id)
+    student = await User.get_motor_collection().find_one(
+        {"telegram_id": telegram_id}, {"_id": 0, "telegram_id": 1, "full_name": 1}
+    )
+    return student or {"telegram_id": telegram_id, "full_name": ""}
+
+
+async def get_enrollment(telegram_id: int, course_id: str) -> Optional[Enrollment]:
+    return await Enrollment.find_one(Enrollment.telegram_id == telegram_id, Enrollment.course_id == course_id)
+
+
+async def enrollment_status(telegram_id: int, course_id: str) -> Optional[str]:
+    """Cached status of one enrollment; a miss loads all of the student's
+    statuses at once, since browsing usually taps several courses."""
+    statuses = await status_cache.get(telegram_id)
+    if statuses is None:
+        epoch = _write_epoch
+        statuses = {e["course_id"]: e["approval_status"] for e in await student_enrollments(telegram_id)}
+        if epoch == _write_epoch:
+            await status_cache.set(telegram_id, statuses)
+    return statuses.get(course_id)
+
+
+async def invalidate_status(telegram_id: int) -> None:
+    global _write_epoch
+    _write_epoch += 1
+    await status_cache.delete(telegram_id)
+
+
+async def student_enrollments(telegram_id: int) -> List[Dict[str, Any]]:
+    """(course_id, approval_status) of every enrollment, oldest first."""
+    cursor = (
+        Enrollment.get_motor_collection()
+        .find({"telegram_id": telegram_id}, {"_id": 0, "course_id": 1, "approval_status": 1})
+        .sort("created_at", ASCENDING)
+    )
+    return await cursor.to_list(length=None)
+
+
+async def user_exists(telegram_id: int) -> bool:
+    return bool(await User.get_motor_collection().count_documents({"telegram_id": telegram_id}, limit=1))
+
+
+async def migrate_embedded_enrollments() -> int:
+    """Backfill the enrollments collection from ``users.courses``.
+
+    Upserts keyed on (telegram_id, course_id) use ``$setOnInsert``, so rows
+    written since the switch are never overwritten and an interrupted run
+    can simply be repeated. The embedded array and its index are dropped
+    afterwards.
+    """
+    users = User.get_motor_collection()
+    target = Enrollment.get_motor_collection()
+    moved = 0
+    cursor = users.find(
+        {"courses": {"$exists": True}},
+        projection={"telegram_id": 1, "courses": 1, "registered_at": 1},
+        batch_size=MIGRATION_BATCH,
+    )
+    async for doc in cursor:
+        ops = []
+        for e in doc.get("courses") or []:
+            if not e.get("course_id"):
+                continue
+            created = e.get("created_at") or doc.get("registered_at") or datetime.utcnow()
+            row = {
+                "telegram_id": doc["telegram_id"],
+                "course_id": e["course_id"],
+                "approval_status": e.get("approval_status") or "pending",
+                "payment_method": e.get("payment_method") or "sham",
+                "payment_receipt": e.get("payment_receipt"),
+                "created_at": created,
+                "updated_at": created,
+            }
+            ops.append(
+                UpdateOne({"telegram_id": row["telegram_id"], "course_id": row["course_id"]}, {"$setOnInsert": row}, upsert=True)
+            )
+        if ops:
+            await bulk_upsert(target, ops)
+            moved += len(ops)
+        await users.update_one({"_id": doc["_id"]}, {"$unset": {"courses": ""}})
+    try:
+        await users.drop_index("courses_approval_status")
+    except OperationFailure:
+        pass
+    if moved:
+        logger.info("Backfilled %s enrollments from users.courses", moved)
+    return moved
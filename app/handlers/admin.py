@@ -1,45 +1,110 @@
-from typing import List, Tuple
+import asyncio
+from typing import Optional
 import logging
+from beanie import PydanticObjectId
+from bson import ObjectId
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 
-from ..models import User, Notification
+from ..models import BroadcastJob
+from ..context import BotContext
+from ..notifications import notify
+from ..enrollments import get_enrollment, set_approval, student_enrollments, user_exists
+from ..broadcast import BroadcastStats, bot_sender, progress_text, set_job_status, set_progress_message, start_job
+from ..keyboards import broadcast_controls_keyboard
 from ..loaders import get_course_by_id, get_group_link
+from ..queries import (
+    PAGE_SIZE,
+    PendingCursor,
+    count_students,
+    pending_cursor,
+    pending_enrollments_page,
+    students_page,
+)
 
 
 AWAITING_DIRECT_MESSAGE = 11
+# Next-page cursors of the most recent pending-list messages, by message id.
+PENDING_CURSORS_KEPT = 10
 
 
 def _is_admin(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
     return user_id == context.bot_data.get("ADMIN_ID")
 
 
-async def _send_pending_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users: List[User] = await User.find_all().to_list()
+async def _pending_list_view(context: ContextTypes.DEFAULT_TYPE, after: Optional[PendingCursor] = None):
+    rows = await pending_enrollments_page(after, PAGE_SIZE + 1)
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
     buttons = []
-    for u in users:
-        for e in u.courses:
-            if e.approval_status == "pending":
-                course = get_course_by_id(e.course_id) or {"name": e.course_id}
-                student_name = u.full_name or str(u.telegram_id)
-                buttons.append([
-                    InlineKeyboardButton(
-                        f"{student_name} • {course.get('name')}",
-                        callback_data=f"admin_pending_{u.telegram_id}_{e.course_id}",
-                    )
-                ])
+    for r in rows:
+        course = get_course_by_id(r["course_id"]) or {"name": r["course_id"]}
+        student_name = r.get("full_name") or str(r["telegram_id"])
+        buttons.append([
+            InlineKeyboardButton(
+                f"{student_name} • {course.get('name')}",
+                callback_data=f"admin_pending_{r['telegram_id']}_{r['course_id']}",
+            )
+        ])
     if not buttons:
+        return None, None, None
+    nav = []
+    if after:
+        nav.append(InlineKeyboardButton("⏮ البداية", callback_data="admin_pendpg_first"))
+    next_cursor = pending_cursor(rows[-1]) if has_more else None
+    if next_cursor:
+        nav.append(InlineKeyboardButton("التالي ⬅️", callback_data="admin_pendpg_next"))
+    if nav:
+        buttons.append(nav)
+    text = "✅ **الطلبات المعلقة للموافقة على الدفع**\n\nاختر طلبًا لعرض التفاصيل:"
+    return text, InlineKeyboardMarkup(buttons), next_cursor
+
+
+def _remember_pending_cursor(context: ContextTypes.DEFAULT_TYPE, message_id: int, cursor: Optional[PendingCursor]) -> None:
+    # The cursor stays server-side, keyed by the list message, since
+    # (timestamp, id, course id) does not fit in the 64-byte callback_data;
+    # "next" on an older list then still continues that list.
+    cursors = context.user_data.setdefault("pending_cursors", {})
+    key = str(message_id)  # user_data is persisted; BSON keys are strings
+    cursors.pop(key, None)
+    if cursor:
+        cursors[key] = cursor
+    while len(cursors) > PENDING_CURSORS_KEPT:
+        del cursors[next(iter(cursors))]
+
+
+async def _send_pending_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, kb, next_cursor = await _pending_list_view(context)
+    if not kb:
         msg = "لا توجد طلبات قيد الانتظار."
         if update.message:
             await update.message.reply_text(msg)
         else:
             await update.effective_chat.send_message(msg)
         return
-    text = "✅ **الطلبات المعلقة للموافقة على الدفع**\n\nاختر طلبًا لعرض التفاصيل:"
     if update.message:
-        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+        sent = await update.message.reply_text(text, reply_markup=kb)
     else:
-        await update.effective_chat.send_message(text, reply_markup=InlineKeyboardMarkup(buttons))
+        sent = await update.effective_chat.send_message(text, reply_markup=kb)
+    _remember_pending_cursor(context, sent.message_id, next_cursor)
+
+
+async def pending_page_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if not _is_admin(context, q.from_user.id):
+        await q.edit_message_text("❌ غير مخول.")
+        return
+    after = None
+    if q.data == "admin_pendpg_next":
+        # A list older than the last PENDING_CURSORS_KEPT starts over.
+        after = context.user_data.get("pending_cursors", {}).get(str(q.message.message_id))
+    text, kb, next_cursor = await _pending_list_view(context, after)
+    if not kb:
+        await q.edit_message_text("لا توجد طلبات قيد الانتظار.")
+        return
+    await q.edit_message_text(text, reply_markup=kb)
+    _remember_pending_cursor(context, q.message.message_id, next_cursor)
 
 
 async def admin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -77,7 +142,7 @@ async def handle_admin_menu_text(update: Update, context: ContextTypes.DEFAULT_T
         await start(update, context)
 
 
-async def admin_pending_detail_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_pending_detail_cb(update: Update, context: BotContext):
     q = update.callback_query
     await q.answer()
     if not _is_admin(context, q.from_user.id):
@@ -89,7 +154,7 @@ async def admin_pending_detail_cb(update: Update, context: ContextTypes.DEFAULT_
     except Exception:
         await q.edit_message_text("❌ بيانات الطلب غير صالحة.")
         return
-    user: User = await User.find_one(User.telegram_id == sid)
+    user, enrollment = await asyncio.gather(context.users.load(sid), get_enrollment(sid, course_id))
     course = get_course_by_id(course_id) or {"name": course_id}
     student_name = (user.full_name if user else None) or str(sid)
     text = (
@@ -98,12 +163,7 @@ async def admin_pending_detail_cb(update: Update, context: ContextTypes.DEFAULT_
         f"المعرف: {sid}\n"
         f"الدورة/المادة: {course.get('name')}\n"
     )
-    receipt = None
-    if user:
-        for e in user.courses:
-            if e.course_id == course_id:
-                receipt = e.payment_receipt
-                break
+    receipt = enrollment.payment_receipt if enrollment else None
     kb = InlineKeyboardMarkup([
         [
             InlineKeyboardButton("موافقة", callback_data=f"admin_approve_{sid}_{course_id}"),
@@ -165,25 +225,20 @@ async def capture_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Admin broadcast flow
     if _is_admin(context, update.effective_user.id) and context.user_data.get("awaiting_broadcast") and update.message and update.message.text:
-        from ..models import User
-        text = update.message.text
-        try:
-            users = await User.find_all().to_list()
-            success_count = 0
-            for u in users:
-                try:
-                    await context.bot.send_message(
-                        chat_id=u.telegram_id, 
-                        text=f"📢 **رسالة من المعلمة**\n\n{text}"
-                    )
-                    success_count += 1
-                except Exception:
-                    continue
-        except Exception as e:
-            await update.message.reply_text(f"❌ حدث خطأ: {str(e)}")
-            return
         context.user_data.pop("awaiting_broadcast", None)
-        await update.message.reply_text(f"✅ تم إرسال البث لـ {success_count} طالب.")
+        job = BroadcastJob(
+            text=f"📢 **رسالة من المعلمة**\n\n{update.message.text}",
+            admin_chat_id=update.effective_chat.id,
+        )
+        await job.insert()
+        progress_msg = await update.message.reply_text(
+            progress_text(BroadcastStats()),
+            reply_markup=broadcast_controls_keyboard(str(job.id), "running"),
+        )
+        job.progress_message_id = progress_msg.message_id
+        await set_progress_message(job.id, job.admin_chat_id, job.progress_message_id)
+        # Runs in the background so the bot keeps serving other updates.
+        start_job(job, bot_sender(context.bot), context.bot)
         return
 
     # Admin direct message flow
@@ -217,28 +272,15 @@ async def approve_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _, _, sid, course_id = q.data.split("_", 3)
     sid = int(sid)
 
-    user: User = await User.find_one(User.telegram_id == sid)
+    user = await set_approval(sid, course_id, "approved")
     if not user:
-        await q.edit_message_text("الطالب غير موجود.")
-        return
-    updated = False
-    for e in user.courses:
-        if e.course_id == course_id:
-            e.approval_status = "approved"
-            updated = True
-            break
-    if not updated:
-        await q.edit_message_text("لا يوجد طلب لهذه الدورة.")
+        if not await user_exists(sid):
+            await q.edit_message_text("الطالب غير موجود.")
+        else:
+            await q.edit_message_text("لا يوجد طلب لهذه الدورة.")
         return
 
-    user.notifications.append(
-        Notification(
-            student_id=user.telegram_id,
-            type="approved",
-            message=f"تمت الموافقة على تسجيلك في {course_id}",
-        )
-    )
-    await user.save()
+    await notify(sid, "approved", f"تمت الموافقة على تسجيلك في {course_id}")
 
     course = get_course_by_id(course_id) or {"name": course_id}
     course_name = course.get("name")
@@ -256,7 +298,7 @@ async def approve_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Notify admin that approval was completed
     admin_id = context.bot_data.get("ADMIN_ID")
     if admin_id:
-        student_name = user.full_name or str(sid)
+        student_name = user.get("full_name") or str(sid)
         try:
             await context.bot.send_message(
                 chat_id=admin_id,
@@ -281,28 +323,15 @@ async def reject_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _, _, sid, course_id = q.data.split("_", 3)
     sid = int(sid)
 
-    user: User = await User.find_one(User.telegram_id == sid)
+    user = await set_approval(sid, course_id, "rejected")
     if not user:
-        await q.edit_message_text("الطالب غير موجود.")
-        return
-    updated = False
-    for e in user.courses:
-        if e.course_id == course_id:
-            e.approval_status = "rejected"
-            updated = True
-            break
-    if not updated:
-        await q.edit_message_text("لا يوجد طلب لهذه الدورة.")
+        if not await user_exists(sid):
+            await q.edit_message_text("الطالب غير موجود.")
+        else:
+            await q.edit_message_text("لا يوجد طلب لهذه الدورة.")
         return
 
-    user.notifications.append(
-        Notification(
-            student_id=user.telegram_id,
-            type="rejected",
-            message=f"تم رفض طلبك للدورة {course_id}",
-        )
-    )
-    await user.save()
+    await notify(sid, "rejected", f"تم رفض طلبك للدورة {course_id}")
 
     course = get_course_by_id(course_id) or {"name": course_id}
     try:
@@ -335,6 +364,10 @@ async def cancel_chat_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # ========== Admin utilities ==========
+async def direct_message_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data.pop("awaiting_direct_to", None)
+
+
 async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.pop("awaiting_contact_message", None)
     context.user_data.pop("awaiting_broadcast", None)
@@ -353,46 +386,120 @@ async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+async def _students_view(mode: str, after: Optional[ObjectId] = None, before: Optional[ObjectId] = None):
+    rows, has_prev, has_next = await students_page(after=after, before=before)
+    if not rows:
+        return None, None
+    buttons = []
+    for u in rows:
+        if mode == "stat":
+            name = u.get("full_name") or f"الطالب {u['telegram_id']}"
+        else:
+            name = u.get("full_name") or str(u["telegram_id"])
+        buttons.append([InlineKeyboardButton(f"👤 {name}", callback_data=f"admin_{mode}_{u['telegram_id']}")])
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton("➡️ السابق", callback_data=f"admin_stpg_{mode}_p_{rows[0]['_id']}"))
+    if has_next:
+        nav.append(InlineKeyboardButton("التالي ⬅️", callback_data=f"admin_stpg_{mode}_n_{rows[-1]['_id']}"))
+    if nav:
+        buttons.append(nav)
+    total = await count_students()
+    if mode == "stat":
+        text = (
+            f"📊 **إحصائيات المعلم**\n\n"
+            f"👥 **عدد المستخدمين:** {total}\n\n"
+            f"اختر طالبًا لعرض تفاصيله:"
+        )
+    else:
+        text = (
+            f"👥 **قائمة الطلاب ({total})**\n\n"
+            "اختر الطالب لإرسال رسالة له:"
+        )
+    return text, InlineKeyboardMarkup(buttons)
+
+
+async def broadcasts_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(context, update.effective_user.id):
+        await update.message.reply_text("❌ غير مخول.")
+        return
+    jobs = await BroadcastJob.find_all().sort(-BroadcastJob.created_at).limit(5).to_list()
+    if not jobs:
+        await update.message.reply_text("لا توجد عمليات بث.")
+        return
+    for job in jobs:
+        stats = BroadcastStats(sent=job.sent, failed=job.failed)
+        preview = job.text.splitlines()[-1][:60]
+        await update.message.reply_text(
+            f"{progress_text(stats, status=job.status)}\n📝 {preview}",
+            reply_markup=broadcast_controls_keyboard(str(job.id), job.status),
+        )
+
+
+async def broadcast_control_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    if not _is_admin(context, q.from_user.id):
+        await q.answer()
+        await q.edit_message_text("❌ غير مخول.")
+        return
+    _, action, job_id = q.data.split("_", 2)
+    status = {"pause": "paused", "resume": "running", "cancel": "cancelled"}[action]
+    job = await set_job_status(PydanticObjectId(job_id), status)
+    if not job:
+        await q.answer("لا يمكن تنفيذ العملية على هذا البث.", show_alert=True)
+        return
+    await q.answer()
+    if status == "running":
+        await set_progress_message(job.id, q.message.chat_id, q.message.message_id)
+        start_job(job, bot_sender(context.bot), context.bot)
+    stats = BroadcastStats(sent=job.sent, failed=job.failed)
+    await q.edit_message_text(
+        progress_text(stats, status=status),
+        reply_markup=broadcast_controls_keyboard(job_id, status),
+    )
+
+
 async def students_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(context, update.effective_user.id):
         await update.message.reply_text("❌ غير مخول.")
         return
-    users: List[User] = await User.find_all().to_list()
-    buttons = []
-    for u in users[:100]:
-        name = u.full_name or str(u.telegram_id)
-        buttons.append([InlineKeyboardButton(f"👤 {name}", callback_data=f"admin_msg_{u.telegram_id}")])
-    if not buttons:
+    text, kb = await _students_view("msg")
+    if not kb:
         await update.message.reply_text("❌ لا يوجد طلاب.")
         return
-    await update.message.reply_text(
-        f"👥 **قائمة الطلاب ({len(users)})**\n\n"
-        "اختر الطالب لإرسال رسالة له:", 
-        reply_markup=InlineKeyboardMarkup(buttons)
-    )
+    await update.message.reply_text(text, reply_markup=kb)
 
 
 async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(context, update.effective_user.id):
         await update.message.reply_text("❌ غير مخول.")
         return
-    users: List[User] = await User.find_all().to_list()
-    buttons = []
-    for u in users[:100]:
-        name = u.full_name or f"الطالب {u.telegram_id}"
-        buttons.append([InlineKeyboardButton(f"👤 {name}", callback_data=f"admin_stat_{u.telegram_id}")])
-    if not buttons:
+    text, kb = await _students_view("stat")
+    if not kb:
         await update.message.reply_text("❌ لا يوجد طلاب.")
         return
-    await update.message.reply_text(
-        f"📊 **إحصائيات المعلم**\n\n"
-        f"👥 **عدد المستخدمين:** {len(users)}\n\n"
-        f"اختر طالبًا لعرض تفاصيله:",
-        reply_markup=InlineKeyboardMarkup(buttons)
-    )
+    await update.message.reply_text(text, reply_markup=kb)
+
+
+async def students_page_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    if not _is_admin(context, q.from_user.id):
+        await q.edit_message_text("❌ غير مخول.")
+        return
+    _, _, mode, direction, oid = q.data.split("_", 4)
+    oid = ObjectId(oid)
+    if direction == "n":
+        text, kb = await _students_view(mode, after=oid)
+    else:
+        text, kb = await _students_view(mode, before=oid)
+    if not kb:
+        await q.edit_message_text("❌ لا يوجد طلاب.")
+        return
+    await q.edit_message_text(text, reply_markup=kb)
 
 
-async def admin_stat_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_stat_select_cb(update: Update, context: BotContext):
     q = update.callback_query
     await q.answer()
     if not _is_admin(context, q.from_user.id):
@@ -404,15 +511,14 @@ async def admin_stat_select_cb(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception:
         await q.edit_message_text("❌ معرف غير صالح.")
         return
-    user: User = await User.find_one(User.telegram_id == tid)
+    user, courses = await asyncio.gather(context.users.load(tid), student_enrollments(tid))
     if not user:
         await q.edit_message_text("❌ الطالب غير موجود.")
         return
     name = user.full_name or f"الطالب {tid}"
-    courses = user.courses or []
     course_lines = []
     for e in courses:
-        c = get_course_by_id(e.course_id) or {"name": e.course_id}
+        c = get_course_by_id(e["course_id"]) or {"name": e["course_id"]}
         course_lines.append(f"• {c.get('name')}")
     courses_block = "\n".join(course_lines) if course_lines else "لا يوجد مواد مسجلة."
     year_text = user.study_year if getattr(user, "study_year", None) else "-"
@@ -430,7 +536,7 @@ async def admin_stat_select_cb(update: Update, context: ContextTypes.DEFAULT_TYP
     await q.edit_message_text(text)
 
 
-async def admin_msg_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_msg_select_cb(update: Update, context: BotContext):
     q = update.callback_query
     await q.answer()
     if not _is_admin(context, q.from_user.id):
@@ -444,7 +550,7 @@ async def admin_msg_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     context.user_data["awaiting_direct_to"] = tid
     # Get student name
-    student = await User.find_one(User.telegram_id == tid)
+    student = await context.users.load(tid)
     student_name = student.full_name if student else f"الطالب {tid}"
     await q.edit_message_text(
         f"📧 **إرسال رسالة**\n\n"
@@ -460,13 +566,17 @@ def get_handlers():
         CommandHandler("admin", admin_cmd),
         CommandHandler("cancel", cancel_cmd),
         CommandHandler("broadcast", broadcast_cmd),
+        CommandHandler("broadcasts", broadcasts_cmd),
         CommandHandler("students", students_cmd),
         CommandHandler("stats", stats_cmd),
+        CallbackQueryHandler(pending_page_cb, pattern="^admin_pendpg_(next|first)$"),
         CallbackQueryHandler(admin_pending_detail_cb, pattern="^admin_pending_"),
         CallbackQueryHandler(approve_cb, pattern="^admin_approve_"),
         CallbackQueryHandler(reject_cb, pattern="^admin_reject_"),
         CallbackQueryHandler(ack_notification_cb, pattern="^notification_course_approved_"),
         CallbackQueryHandler(admin_stat_select_cb, pattern="^admin_stat_"),
+        CallbackQueryHandler(broadcast_control_cb, pattern="^bcast_(pause|resume|cancel)_[0-9a-f]{24}$"),
+        CallbackQueryHandler(students_page_cb, pattern="^admin_stpg_(msg|stat)_(n|p)_[0-9a-f]{24}$"),
         CallbackQueryHandler(start_chat_cb, pattern="^start_chat$"),
         CallbackQueryHandler(cancel_chat_cb, pattern="^cancel_chat$"),
         # Admin menu buttons - must be before other text handlers
@@ -2,10 +2,18 @@ from typing import Optional, List, Dict
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes, MessageHandler, CommandHandler, CallbackQueryHandler, filters
 
-from ..models import User
-from ..loaders import get_courses, get_course_by_id, get_group_link
-from ..catalog import MATERIALS_BY_YEAR, MATERIALS, get_materials_by_year_semester, calculate_materials_price
-from ..keyboards import get_courses_keyboard, course_details_keyboard, categories_keyboard
+from ..enrollments import enrollment_status, student_enrollments
+from ..loaders import get_course_by_id, get_group_link
+from ..catalog import MATERIALS, calculate_materials_price
+from ..keyboards import (
+    get_courses_keyboard,
+    course_details_keyboard,
+    categories_keyboard,
+    university_years_keyboard,
+    semesters_keyboard,
+    materials_keyboard,
+    material_detail_keyboard,
+)
 
 
 CATEGORY_PRO = "📚 الدورات الاحترافية"
@@ -56,8 +64,8 @@ async def handle_category_text(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     if text == "📋 حالة الدفع":
-        user_doc: User = await User.find_one(User.telegram_id == update.effective_user.id)
-        if not user_doc or not user_doc.courses:
+        enrollments = await student_enrollments(update.effective_user.id)
+        if not enrollments:
             await update.message.reply_text(
                 "📋 حالة دفعاتك:\n\n"
                 "❌ لم تقم بتسجيل أي دورات حتى الآن.\n\n"
@@ -66,12 +74,13 @@ async def handle_category_text(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         status_text = "📋 حالة دفعاتك:\n\n"
-        for course in user_doc.courses:
-            course_obj = get_course_by_id(course.course_id)
-            course_name = course_obj.get("name") if course_obj else course.course_id
-            status_emoji = "✅" if course.approval_status == "approved" else "⏳" if course.approval_status == "pending" else "❌"
+        for course in enrollments:
+            course_obj = get_course_by_id(course["course_id"])
+            course_name = course_obj.get("name") if course_obj else course["course_id"]
+            status = course["approval_status"]
+            status_emoji = "✅" if status == "approved" else "⏳" if status == "pending" else "❌"
             status_text += f"{status_emoji} {course_name}\n"
-            status_text += f"   الحالة: {course.approval_status}\n\n"
+            status_text += f"   الحالة: {status}\n\n"
         
         await update.message.reply_text(status_text)
         return
@@ -108,13 +117,7 @@ async def course_details_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Check enrollment status
-    user_doc: User = await User.find_one(User.telegram_id == q.from_user.id)
-    status = None
-    if user_doc:
-        for e in user_doc.courses:
-            if e.course_id == course_id:
-                status = e.approval_status
-                break
+    status = await enrollment_status(q.from_user.id, course_id)
 
     if status == "approved":
         # Show full details for approved students
@@ -134,23 +137,11 @@ async def course_details_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ================= University hierarchical UI =================
 async def _send_university_years(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    buttons = [
-        [InlineKeyboardButton("📚 السنة الثالثة", callback_data="uni_year_3")],
-        [InlineKeyboardButton("📚 السنة الرابعة (ذكاء)", callback_data="uni_year_4")],
-        [InlineKeyboardButton("📚 السنة الخامسة (ذكاء)", callback_data="uni_year_5")],
-    ]
-    buttons.append([InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")])
-    return await update.message.reply_text("🎓 المواد الجامعية\n\nاختر السنة:", reply_markup=InlineKeyboardMarkup(buttons))
+    return await update.message.reply_text("🎓 المواد الجامعية\n\nاختر السنة:", reply_markup=university_years_keyboard())
 
 
 async def _edit_university_years(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    buttons = [
-        [InlineKeyboardButton("📚 السنة الثالثة", callback_data="uni_year_3")],
-        [InlineKeyboardButton("📚 السنة الرابعة (ذكاء)", callback_data="uni_year_4")],
-        [InlineKeyboardButton("📚 السنة الخامسة (ذكاء)", callback_data="uni_year_5")],
-    ]
-    buttons.append([InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")])
-    await update.callback_query.edit_message_text("🎓 المواد الجامعية\n\nاختر السنة:", reply_markup=InlineKeyboardMarkup(buttons))
+    await update.callback_query.edit_message_text("🎓 المواد الجامعية\n\nاختر السنة:", reply_markup=university_years_keyboard())
 
 
 async def uni_year_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -159,29 +150,7 @@ async def uni_year_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     year = int(q.data.split("_")[-1])
     context.user_data["uni_ctx"] = {"year": year}
     year_name = {3: "الثالثة ", 4: "الرابعة (ذكاء)", 5: " (ذكاء)الخامسة"}.get(year, str(year))
-    buttons = [
-        [InlineKeyboardButton("📚 الفصل الأول", callback_data=f"uni_sem_{year}_1")],
-        [InlineKeyboardButton("📚 الفصل الثاني", callback_data=f"uni_sem_{year}_2")],
-        [InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")],
-    ]
-    await q.edit_message_text(f"📖 السنة {year_name}\n\nاختر الفصل:", reply_markup=InlineKeyboardMarkup(buttons))
-
-
-def _materials_keyboard(year: int, sem: int, selected: List[str]) -> InlineKeyboardMarkup:
-    mats = get_materials_by_year_semester(year, sem)
-    rows: List[List[InlineKeyboardButton]] = []
-    for m in mats:
-        mid = m["id"]
-        name = m["name"]
-        chosen = "✅" if mid in selected else "➕"
-        rows.append([
-            InlineKeyboardButton(f"📖 {name}", callback_data=f"uni_detail_{mid}"),
-            InlineKeyboardButton(f"{chosen}", callback_data=f"uni_toggle_{mid}"),
-        ])
-    # cart and back
-    rows.append([InlineKeyboardButton(f"🧺 السلة ({len(selected)})", callback_data="uni_cart")])
-    rows.append([InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")])
-    return InlineKeyboardMarkup(rows)
+    await q.edit_message_text(f"📖 السنة {year_name}\n\nاختر الفصل:", reply_markup=semesters_keyboard(year))
 
 
 async def uni_sem_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -193,7 +162,7 @@ async def uni_sem_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     selected: List[str] = context.user_data.get("uni_selected") or []
     await q.edit_message_text(
         "اختر المواد (يمكنك اختيار أكثر من مادة):",
-        reply_markup=_materials_keyboard(year, sem, selected),
+        reply_markup=materials_keyboard(year, sem, selected),
     )
 
 
@@ -216,12 +185,7 @@ async def uni_detail_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• تقييم دوري لمستوى التقدم الأكاديمي"
     )
     # Add payment and contact buttons
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton("💳 الدفع عبر Sham", callback_data=f"pay_sham_{mid}"), InlineKeyboardButton("💳 الدفع عبر HARAM", callback_data=f"pay_haram_{mid}")],
-        [InlineKeyboardButton("➕ إضافة للسلة", callback_data=f"uni_toggle_{mid}" )],
-        [InlineKeyboardButton("💬 تواصل مع الإدارة", callback_data="contact_admin")],
-        [InlineKeyboardButton("⬅️ رجوع", callback_data=f"uni_sem_{mat.get('year')}_{mat.get('semester')}")],
-    ])
+    kb = material_detail_keyboard(mid, mat.get("year"), mat.get("semester"))
     await q.edit_message_text(text, reply_markup=kb)
 
 
@@ -243,7 +207,7 @@ async def uni_toggle_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if year and sem:
         await q.edit_message_text(
             f"اختر المواد (محدد: {len(selected)}):",
-            reply_markup=_materials_keyboard(year, sem, selected),
+            reply_markup=materials_keyboard(year, sem, selected),
         )
     else:
         await _edit_university_years(update, context)
@@ -287,7 +251,7 @@ async def uni_clear_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ctx = context.user_data.get("uni_ctx") or {}
     year, sem = ctx.get("year"), ctx.get("sem")
     if year and sem:
-        await q.edit_message_text("تم إفراغ السلة.", reply_markup=_materials_keyboard(year, sem, []))
+        await q.edit_message_text("تم إفراغ السلة.", reply_markup=materials_keyboard(year, sem, []))
     else:
         await _edit_university_years(update, context)
 
@@ -1,14 +1,17 @@
 from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, MessageHandler, filters
-from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 
-from ..models import User, CourseEnrollment, Notification
+from ..models import User
+from ..context import BotContext
+from ..enrollments import submit_payment
+from ..notifications import notify
 from ..loaders import get_course_by_id
 
 
-async def _find_or_create_user(tg_user_id: int) -> User:
-    user = await User.find_one(User.telegram_id == tg_user_id)
+async def _find_or_create_user(context: BotContext, tg_user_id: int) -> User:
+    user = await context.users.load(tg_user_id)
     if not user:
         user = User(
             telegram_id=tg_user_id,
@@ -16,7 +19,12 @@ async def _find_or_create_user(tg_user_id: int) -> User:
             phone="",
             email="",
         )
-        await user.save()
+        try:
+            await user.insert()
+        except DuplicateKeyError:
+            # Created concurrently; telegram_id is unique.
+            user = await User.find_one(User.telegram_id == tg_user_id)
+        context.users.prime(user)
     return user
 
 
@@ -81,7 +89,7 @@ async def pay_method_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.edit_message_text(text)
 
 
-async def receive_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def receive_receipt(update: Update, context: BotContext):
     if not update.message or not update.message.photo:
         return
     course_id = context.user_data.get("payment_course_id")
@@ -92,57 +100,12 @@ async def receive_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     file_id = update.message.photo[-1].file_id
-    student = await _find_or_create_user(update.effective_user.id)
+    student = await _find_or_create_user(context, update.effective_user.id)
 
     # Two flows: single course or multiple materials from university cart
     # mat_ids was already fetched above
-    if mat_ids:
-        for mid in mat_ids:
-            updated = False
-            for e in student.courses:
-                if e.course_id == mid:
-                    e.payment_method = method
-                    e.payment_receipt = file_id
-                    e.approval_status = "pending"
-                    updated = True
-                    break
-            if not updated:
-                student.courses.append(
-                    CourseEnrollment(
-                        course_id=mid,
-                        payment_method=method,
-                        payment_receipt=file_id,
-                        approval_status="pending",
-                    )
-                )
-    else:
-        # single course/material
-        updated = False
-        for e in student.courses:
-            if e.course_id == course_id:
-                e.payment_method = method
-                e.payment_receipt = file_id
-                e.approval_status = "pending"
-                updated = True
-                break
-        if not updated:
-            student.courses.append(
-                CourseEnrollment(
-                    course_id=course_id,
-                    payment_method=method,
-                    payment_receipt=file_id,
-                    approval_status="pending",
-                )
-            )
-    student.notifications.append(
-        Notification(
-            student_id=student.telegram_id,
-            type="payment_submitted",
-            message=f"تم إرسال إثبات الدفع",
-        )
-    )
-    student.last_active = datetime.utcnow()
-    await student.save()
+    await submit_payment(student.telegram_id, mat_ids or [course_id], method, file_id)
+    await notify(student.telegram_id, "payment_submitted", f"تم إرسال إثبات الدفع")
 
     # notify admin per item without sending the photo
     if mat_ids:
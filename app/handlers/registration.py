@@ -1,14 +1,23 @@
 from telegram import Update, ReplyKeyboardMarkup
-from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
+from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, TypeHandler, filters
 from beanie import PydanticObjectId
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 from ..models import User
+from ..context import BotContext
+from ..idle import CONVERSATION_TIMEOUT
 from ..keyboards import categories_keyboard, main_menu_keyboard, admin_menu_keyboard
 
 ASKING_NAME, ASKING_PHONE, ASKING_EMAIL, ASKING_YEAR, ASKING_SPECIALIZATION = range(5)
+_REGISTRATION_FIELDS = ("full_name", "phone", "email", "study_year")
 
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def _clear_registration(context: ContextTypes.DEFAULT_TYPE) -> None:
+    for key in _REGISTRATION_FIELDS:
+        context.user_data.pop(key, None)
+
+
+async def start(update: Update, context: BotContext):
     user = update.effective_user
     admin_id = context.bot_data.get("ADMIN_ID")
     if admin_id and user.id == admin_id:
@@ -19,10 +28,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=admin_menu_keyboard(),
         )
         return ConversationHandler.END
-    existing = await User.find_one(User.telegram_id == user.id)
+    existing = await context.users.load(user.id)
     if existing and existing.phone and existing.email:
-        existing.last_active = datetime.utcnow()
-        await existing.save()
         await update.message.reply_text(
             f"👋 **مرحباً {existing.full_name}!**\n\n"
             "🎓 **منصة التعليم الإلكترونية**\n\n"
@@ -99,7 +106,7 @@ async def ask_specialization(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ASKING_SPECIALIZATION
 
 
-async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def finish_registration(update: Update, context: BotContext):
     spec_text = (update.message.text or "").strip()
     if spec_text == "❌ إلغاء":
         await update.message.reply_text("❌ تم إلغاء التسجيل.")
@@ -129,9 +136,9 @@ async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
     email = context.user_data.get("email")
     study_year = context.user_data.get("study_year")
     tg_user = update.effective_user
-    user_doc = await User.find_one(User.telegram_id == tg_user.id)
+    user_doc = await context.users.load(tg_user.id)
     is_new = user_doc is None
-    if not user_doc:
+    if is_new:
         user_doc = User(
             telegram_id=tg_user.id,
             full_name=full_name,
@@ -140,14 +147,20 @@ async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
             study_year=study_year,
             specialization=specialization,
         )
-    else:
+        try:
+            await user_doc.insert()
+        except DuplicateKeyError:
+            # Created meanwhile (web payment approval, a repeated submit).
+            user_doc = await User.find_one(User.telegram_id == tg_user.id)
+            is_new = False
+    if not is_new:
         user_doc.full_name = full_name
         user_doc.phone = phone
         user_doc.email = email
         user_doc.study_year = study_year
         user_doc.specialization = specialization
         user_doc.last_active = datetime.utcnow()
-    await user_doc.save()
+        await user_doc.save()
 
     admin_id = context.bot_data.get("ADMIN_ID")
     if is_new and admin_id:
@@ -174,14 +187,20 @@ async def finish_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
         "اختر من القائمة أدناه لبدء رحلتك التعليمية:", 
         reply_markup=main_menu_keyboard()
     )
+    _clear_registration(context)
     return ConversationHandler.END
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _clear_registration(context)
     await update.message.reply_text("تم الإلغاء.")
     return ConversationHandler.END
 
 
+async def registration_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _clear_registration(context)
+
+
 def get_handler() -> ConversationHandler:
     return ConversationHandler(
         entry_points=[CommandHandler("start", start)],
@@ -191,8 +210,10 @@ def get_handler() -> ConversationHandler:
             ASKING_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_study_year)],
             ASKING_YEAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_specialization)],
             ASKING_SPECIALIZATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, finish_registration)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, registration_timeout)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         name="registration_conversation",
-        persistent=False,
+        persistent=True,
+        conversation_timeout=CONVERSATION_TIMEOUT,
     )
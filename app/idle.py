@@ -0,0 +1,91 @@
+"""Eviction of idle per-user state and a gauge of what is left.
+
+PTB keeps ``user_data``/``chat_data`` for every user that ever wrote to
+the bot until the process exits. A TypeHandler notes when each user was
+last seen; a repeating job evicts the in-memory state of anyone idle for
+longer than IDLE_STATE_TTL and logs how many entries remain and roughly
+how big they are. Eviction is from memory only: the persisted copy (cart,
+half-finished registration) stays, and MongoPersistence loads it back
+before the user's next update reaches any handler.
+"""
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from .persistence import MongoPersistence
+
+IDLE_STATE_TTL = float(os.getenv("IDLE_STATE_TTL", str(6 * 3600)))
+IDLE_SWEEP_INTERVAL = float(os.getenv("IDLE_SWEEP_INTERVAL", "600"))
+CONVERSATION_TIMEOUT = float(os.getenv("CONVERSATION_TIMEOUT", "900"))
+# Its own group: only one handler per group runs for an update, and the
+# activity recorder already occupies group -1.
+IDLE_GROUP = -2
+
+logger = logging.getLogger(__name__)
+
+_last_seen: Dict[int, float] = {}
+
+
+def _deep_size(obj: Any, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(v, seen) for v in obj)
+    return size
+
+
+def user_data_gauge(application: Application) -> Tuple[int, int]:
+    """(live user_data entries, approximate bytes held by them)."""
+    data = application.user_data
+    seen: set = set()
+    return len(data), sum(_deep_size(v, seen) for v in data.values())
+
+
+async def sweep(application: Application, ttl: float = IDLE_STATE_TTL) -> int:
+    now = time.monotonic()
+    # Entries restored from persistence have no sighting yet; start their
+    # clock now instead of dropping them on the first sweep.
+    for uid in application.user_data:
+        _last_seen.setdefault(uid, now)
+    # Hand every pending change to persistence first, so what is evicted
+    # below is only a copy. Nothing awaits between here and the evictions.
+    await application.update_persistence()
+    expired = [uid for uid, ts in _last_seen.items() if now - ts > ttl]
+    for uid in expired:
+        del _last_seen[uid]
+        # Not drop_user_data(): that deletes the persisted document too, and
+        # PTB has no public way to drop the in-memory entry alone. Private
+        # attribute of python-telegram-bot 20.7 (pinned in requirements.txt).
+        if application._user_data.pop(uid, None) is not None and isinstance(application.persistence, MongoPersistence):
+            application.persistence.user_data_evicted(uid)
+        # Private chats share the user's id; chat_data is not persisted.
+        if uid in application.chat_data:
+            application.drop_chat_data(uid)
+    return len(expired)
+
+
+async def _sweep_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    dropped = await sweep(context.application)
+    count, size = user_data_gauge(context.application)
+    logger.info("user_data: %s live entries, ~%.1f KiB; %s idle dropped", count, size / 1024, dropped)
+
+
+def start(application: Application, interval: float = IDLE_SWEEP_INTERVAL) -> None:
+    application.job_queue.run_repeating(_sweep_job, interval=interval, first=interval, name="idle_sweep")
+
+
+async def _seen(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user:
+        _last_seen[update.effective_user.id] = time.monotonic()
+
+
+idle_handler = TypeHandler(Update, _seen)
@@ -1,25 +1,92 @@
-from typing import List
+from functools import lru_cache
+from typing import List, FrozenSet, Optional, Tuple
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
-from .loaders import get_courses
+from .catalog import MATERIALS_BY_YEAR, YEAR_NAMES
+from .loaders import get_courses, get_index
+
+# Markups are immutable once built, so one instance can be shared by every
+# chat. Static menus are built at import; menus that depend on the catalog
+# or on the cart go through bounded LRUs keyed by the catalog version.
+KEYBOARD_CACHE_SIZE = 512
+
+
+def _reply_keyboard(rows: List[List[str]]) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(rows, resize_keyboard=True)
+
+
+_CATEGORIES_KB = _reply_keyboard([["📚 الدورات الاحترافية", "🎓 المواد الجامعية"]])
+
+# Main menu for students after login
+_MAIN_MENU_KB = _reply_keyboard(
+    [
+        ["📚 الدورات الاحترافية", "🎓 المواد الجامعية"],
+        ["💬 تواصل مع المعلمة", "📋 حالة الدفع"],
+    ]
+)
+
+# Main menu for admin
+_ADMIN_MENU_KB = _reply_keyboard(
+    [
+        ["✅ الموافقة على الدفع", "👥 قائمة الطلاب"],
+        ["📢  ارسال رسالة", "📊 الإحصائيات"],
+        ["🏠 الرئيسية"],
+    ]
+)
+
+_BACK_ROW = [InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")]
+
+_UNIVERSITY_YEARS_KB = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(f"📚 {name}", callback_data=f"uni_year_{year}")] for year, name in YEAR_NAMES.items()]
+    + [_BACK_ROW]
+)
 
 
 def categories_keyboard() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        [["📚 الدورات الاحترافية", "🎓 المواد الجامعية"]], resize_keyboard=True
+    return _CATEGORIES_KB
+
+
+def main_menu_keyboard() -> ReplyKeyboardMarkup:
+    """Main menu for students after login"""
+    return _MAIN_MENU_KB
+
+
+def admin_menu_keyboard() -> ReplyKeyboardMarkup:
+    """Main menu for admin"""
+    return _ADMIN_MENU_KB
+
+
+def university_years_keyboard() -> InlineKeyboardMarkup:
+    return _UNIVERSITY_YEARS_KB
+
+
+@lru_cache(maxsize=16)
+def semesters_keyboard(year: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton("📚 الفصل الأول", callback_data=f"uni_sem_{year}_1")],
+            [InlineKeyboardButton("📚 الفصل الثاني", callback_data=f"uni_sem_{year}_2")],
+            _BACK_ROW,
+        ]
     )
 
 
 def get_courses_keyboard(category: str) -> InlineKeyboardMarkup:
+    return _courses_keyboard(get_index().version, category)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _courses_keyboard(version: Tuple[float, float], category: str) -> InlineKeyboardMarkup:
     courses = get_courses(category)
     buttons: List[List[InlineKeyboardButton]] = []
     for c in courses:
         buttons.append([
             InlineKeyboardButton(f"📖 {c.get('name', c.get('id'))}", callback_data=f"course_{c['id']}")
         ])
-    buttons.append([InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")])
+    buttons.append(_BACK_ROW)
     return InlineKeyboardMarkup(buttons)
 
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def course_details_keyboard(course_id: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         [
@@ -28,29 +95,63 @@ def course_details_keyboard(course_id: str) -> InlineKeyboardMarkup:
                 InlineKeyboardButton("💳 HARAM", callback_data=f"pay_haram_{course_id}"),
             ],
             [InlineKeyboardButton("💬 تواصل مع المعلمة", callback_data="contact_admin")],
-            [InlineKeyboardButton("⬅️ رجوع", callback_data="back_courses")],
+            _BACK_ROW,
         ]
     )
 
 
-def main_menu_keyboard() -> ReplyKeyboardMarkup:
-    """Main menu for students after login"""
-    return ReplyKeyboardMarkup(
-        [
-            ["📚 الدورات الاحترافية", "🎓 المواد الجامعية"],
-            ["💬 تواصل مع المعلمة", "📋 حالة الدفع"],
-        ],
-        resize_keyboard=True
-    )
+def materials_keyboard(year: int, sem: int, selected: List[str]) -> InlineKeyboardMarkup:
+    # Only the ticks of this semester and the cart size change the markup,
+    # so carts that differ elsewhere still share a cache entry.
+    mids = MATERIALS_BY_YEAR.get(year, {}).get(sem, [])
+    chosen = frozenset(mid for mid in selected if mid in mids)
+    return _materials_keyboard(get_index().version, year, sem, chosen, len(selected))
 
 
-def admin_menu_keyboard() -> ReplyKeyboardMarkup:
-    """Main menu for admin"""
-    return ReplyKeyboardMarkup(
-        [
-            ["✅ الموافقة على الدفع", "👥 قائمة الطلاب"],
-            ["📢  ارسال رسالة", "📊 الإحصائيات"],
-            ["🏠 الرئيسية"],
-        ],
-        resize_keyboard=True
-    )
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _materials_keyboard(
+    version: Tuple[float, float], year: int, sem: int, chosen: FrozenSet[str], cart_size: int
+) -> InlineKeyboardMarkup:
+    courses = get_index().courses
+    rows: List[List[InlineKeyboardButton]] = []
+    for mid in MATERIALS_BY_YEAR.get(year, {}).get(sem, []):
+        m = courses.get(mid)
+        if not m:
+            continue
+        mark = "✅" if mid in chosen else "➕"
+        rows.append([
+            InlineKeyboardButton(f"📖 {m['name']}", callback_data=f"uni_detail_{mid}"),
+            InlineKeyboardButton(f"{mark}", callback_data=f"uni_toggle_{mid}"),
+        ])
+    # cart and back
+    rows.append([InlineKeyboardButton(f"🧺 السلة ({cart_size})", callback_data="uni_cart")])
+    rows.append(_BACK_ROW)
+    return InlineKeyboardMarkup(rows)
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def material_detail_keyboard(mid: str, year: int, sem: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("💳 الدفع عبر Sham", callback_data=f"pay_sham_{mid}"), InlineKeyboardButton("💳 الدفع عبر HARAM", callback_data=f"pay_haram_{mid}")],
+        [InlineKeyboardButton("➕ إضافة للسلة", callback_data=f"uni_toggle_{mid}")],
+        [InlineKeyboardButton("💬 تواصل مع الإدارة", callback_data="contact_admin")],
+        [InlineKeyboardButton("⬅️ رجوع", callback_data=f"uni_sem_{year}_{sem}")],
+    ])
+
+
+def broadcast_controls_keyboard(job_id: str, status: str) -> Optional[InlineKeyboardMarkup]:
+    if status == "running":
+        first = InlineKeyboardButton("⏸ إيقاف مؤقت", callback_data=f"bcast_pause_{job_id}")
+    elif status == "paused":
+        first = InlineKeyboardButton("▶️ استئناف", callback_data=f"bcast_resume_{job_id}")
+    else:
+        return None
+    return InlineKeyboardMarkup([[first, InlineKeyboardButton("🛑 إلغاء", callback_data=f"bcast_cancel_{job_id}")]])
+
+
+def warm_keyboards() -> None:
+    """Build the catalog menus up front so the first taps hit the cache."""
+    for year in MATERIALS_BY_YEAR:
+        semesters_keyboard(year)
+    for category in ("professional", "university"):
+        get_courses_keyboard(category)
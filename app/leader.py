@@ -0,0 +1,141 @@
+"""Mongo lease election and the shared webhook inbox.
+
+Under ``uvicorn --workers N`` every process serves pages, but only one
+may own the Telegram bot (its Application, set_webhook, resumed jobs).
+Processes race for a lease document; the holder renews it every
+``LEASE_TTL / 3`` seconds and a crashed holder is replaced once its lease
+expires.
+
+Any process can receive the webhook POST, so updates are written to the
+``bot_inbox`` collection (update_id is unique, which also drops Telegram's
+redeliveries) and the leader drains them in arrival order. Updates queued
+while leadership moves are picked up by the next leader.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .config import str_to_bool
+from .models import Lease, QueuedUpdate
+
+LEADER_ELECTION = str_to_bool(os.getenv("BOT_LEADER_ELECTION", "false"))
+LEASE_TTL = float(os.getenv("BOT_LEASE_TTL", "15"))
+INBOX_POLL_INTERVAL = float(os.getenv("BOT_INBOX_POLL_INTERVAL", "0.25"))
+INBOX_BATCH = 100
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class MongoLease:
+    def __init__(self, name: str, ttl: float = LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+    async def try_acquire(self) -> bool:
+        """Take or renew the lease; True while this process holds it."""
+        now = datetime.utcnow()
+        try:
+            doc = await Lease.get_motor_collection().find_one_and_update(
+                {"name": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Held by someone else: the filter missed and the upsert collided.
+            return False
+        return bool(doc) and doc.get("owner") == self.owner
+
+    async def release(self) -> None:
+        await Lease.get_motor_collection().delete_one({"name": self.name, "owner": self.owner})
+        self.is_leader = False
+
+    async def run(self, on_elected: Callback, on_demoted: Callback) -> None:
+        # on_elected runs as its own task so the lease keeps being renewed
+        # while the role starts up; init_db alone can outlast the TTL.
+        startup: Optional[asyncio.Task] = None
+        try:
+            while True:
+                try:
+                    held = await self.try_acquire()
+                except Exception:
+                    logger.exception("Lease %s renewal failed", self.name)
+                    held = False
+                if held and not self.is_leader:
+                    self.is_leader = True
+                    logger.info("Acquired lease %s as %s", self.name, self.owner)
+                    startup = asyncio.create_task(on_elected())
+                elif not held and self.is_leader:
+                    self.is_leader = False
+                    logger.warning("Lost lease %s", self.name)
+                    await _cancel(startup)
+                    startup = None
+                    await on_demoted()
+                if startup is not None and startup.done():
+                    error = None if startup.cancelled() else startup.exception()
+                    if startup.cancelled() or error is not None:
+                        # Let another process try instead of holding a dead role.
+                        logger.error("Starting %s failed; releasing the lease", self.name, exc_info=error)
+                        await on_demoted()
+                        await self.release()
+                    startup = None
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            await _cancel(startup)
+            if self.is_leader:
+                await on_demoted()
+                try:
+                    await self.release()
+                except Exception:
+                    pass
+
+
+async def _cancel(task: Optional[asyncio.Task]) -> None:
+    if task is not None and not task.done():
+        task.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await task
+
+
+async def push_update(payload: Dict[str, Any]) -> None:
+    try:
+        await QueuedUpdate(update_id=payload["update_id"], payload=payload).insert()
+    except DuplicateKeyError:
+        pass  # redelivery of an update already queued
+
+
+async def drain_inbox(handle: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+    """Hand queued updates to ``handle`` oldest first, forever (leader only)."""
+    inbox = QueuedUpdate.get_motor_collection()
+    while True:
+        try:
+            docs: List[Dict[str, Any]] = (
+                await inbox.find({}).sort("update_id", ASCENDING).limit(INBOX_BATCH).to_list(length=INBOX_BATCH)
+            )
+        except Exception:
+            logger.exception("Reading the bot inbox failed")
+            await asyncio.sleep(INBOX_POLL_INTERVAL * 10)
+            continue
+        handled = []
+        try:
+            for doc in docs:
+                await handle(doc["payload"])
+                handled.append(doc["_id"])
+        except Exception:
+            logger.exception("Inbox handler failed; retrying from update %s", docs[len(handled)]["update_id"])
+        if handled:
+            await inbox.delete_many({"_id": {"$in": handled}})
+        if len(handled) < len(docs) or not docs:
+            await asyncio.sleep(INBOX_POLL_INTERVAL)
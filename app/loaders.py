@@ -1,17 +1,26 @@
 import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional, Tuple
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 COURSES_FILE = DATA_DIR / "courses.json"
 GROUP_LINKS_FILE = DATA_DIR / "group_links.json"
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "5"))
+
+logger = logging.getLogger(__name__)
 
 try:
     # Primary source provided by user
-    from .catalog import COURSES as CATALOG_COURSES, MATERIALS as CATALOG_MATERIALS
+    from .catalog import COURSES as CATALOG_COURSES, MATERIALS as CATALOG_MATERIALS, MATERIAL_ALIASES
 except Exception:
-    CATALOG_COURSES, CATALOG_MATERIALS = {}, {}
+    CATALOG_COURSES, CATALOG_MATERIALS, MATERIAL_ALIASES = {}, {}, {}
 
 
 def _read_json(path: Path) -> Any:
@@ -36,6 +45,7 @@ def _course_from_catalog(cid: str) -> Optional[Dict[str, Any]]:
         "price": c.get("price"),
         "level": c.get("level"),
         "category": c.get("category"),
+        "projects": [p.get("name") for p in c.get("projects") or []],
     }
 
 
@@ -145,40 +155,153 @@ def _build_university_courses(data: Dict[str, Any]) -> List[Dict[str, Any]]:
     return courses
 
 
-def get_courses(category: str) -> List[Dict[str, Any]]:
-    data = _read_json(COURSES_FILE)
-    if category == "professional":
-        return _build_professional_courses(data)
-    if category == "university":
-        return _build_university_courses(data)
-    return []
-
-
-def get_course_by_id(course_id: str) -> Optional[Dict[str, Any]]:
-    # Prefer catalog first
-    if CATALOG_COURSES.get(course_id):
-        return _course_from_catalog(course_id)
-    if CATALOG_MATERIALS.get(course_id):
-        return _material_from_catalog(course_id)
-    # Fallback to derived lists
-    data = _read_json(COURSES_FILE)
-    for c in _build_professional_courses(data):
-        if c.get("id") == course_id:
-            return c
-    for c in _build_university_courses(data):
-        if c.get("id") == course_id:
-            return c
-    return None
+def _file_mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
 
 
-def get_group_link(course_id: str) -> Optional[str]:
-    links = _read_json(GROUP_LINKS_FILE) or {}
-    # flat mapping support
-    if course_id in links:
-        return links.get(course_id)
+def _catalog_version() -> Tuple[float, float]:
+    return (_file_mtime(COURSES_FILE), _file_mtime(GROUP_LINKS_FILE))
+
+
+def _flatten_group_links(links: Dict[str, Any]) -> Dict[str, str]:
+    flat: Dict[str, str] = {}
     # nested mapping support
     for section in ("courses", "materials"):
         sec = links.get(section)
-        if isinstance(sec, dict) and course_id in sec:
-            return sec.get(course_id)
-    return None
+        if isinstance(sec, dict):
+            flat.update({k: v for k, v in sec.items() if isinstance(v, str)})
+    # flat mapping support (takes precedence, as before)
+    flat.update({k: v for k, v in links.items() if isinstance(v, str)})
+    return flat
+
+
+@dataclass(frozen=True)
+class CatalogIndex:
+    """Immutable compiled snapshot of the catalog: every lookup is a dict access.
+
+    Snapshots are never modified after they are built; a reload builds a new
+    one and swaps the module reference, so readers see either the old or the
+    new catalog, never a mix.
+    """
+
+    version: Tuple[float, float]
+    courses: Mapping[str, Mapping[str, Any]]
+    group_links: Mapping[str, str]
+    categories: Mapping[str, Tuple[Mapping[str, Any], ...]]
+    aliases: Mapping[str, str]
+
+    def resolve(self, course_id: str) -> str:
+        """Map a legacy/alias id to its canonical catalog id."""
+        return self.aliases.get(course_id, course_id)
+
+
+def _freeze(course: Dict[str, Any]) -> Mapping[str, Any]:
+    return MappingProxyType(dict(course))
+
+
+def build_index() -> CatalogIndex:
+    version = _catalog_version()
+    data = _read_json(COURSES_FILE) or {}
+    professional = [_freeze(c) for c in _build_professional_courses(data)]
+    university = [_freeze(c) for c in _build_university_courses(data)]
+
+    # Same precedence as the old lookup chain: catalog courses, catalog
+    # materials, then the derived professional/university lists.
+    courses: Dict[str, Mapping[str, Any]] = {}
+    for cid in CATALOG_COURSES:
+        courses.setdefault(cid, _freeze(_course_from_catalog(cid)))
+    for mid in CATALOG_MATERIALS:
+        courses.setdefault(mid, _freeze(_material_from_catalog(mid)))
+    for c in professional + university:
+        courses.setdefault(c["id"], c)
+
+    return CatalogIndex(
+        version=version,
+        courses=MappingProxyType(courses),
+        group_links=MappingProxyType(_flatten_group_links(_read_json(GROUP_LINKS_FILE) or {})),
+        categories=MappingProxyType({"professional": tuple(professional), "university": tuple(university)}),
+        aliases=MappingProxyType({a: cid for a, cid in MATERIAL_ALIASES.items() if cid in courses}),
+    )
+
+
+_index: Optional[CatalogIndex] = None
+_reload_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+_failed_version: Optional[Tuple[float, float]] = None
+
+
+def get_index() -> CatalogIndex:
+    index = _index
+    if index is None:
+        reload_index()
+        index = _index
+    return index
+
+
+def reload_index(force: bool = False) -> bool:
+    """Rebuild the snapshot if the data files changed. Returns True on swap.
+
+    A file caught mid-write (invalid JSON) keeps the current snapshot; the
+    next check retries because the version stamp was not advanced.
+    """
+    global _index, _failed_version
+    with _reload_lock:
+        current = _index
+        version = _catalog_version()
+        if current is not None and not force and version in (current.version, _failed_version):
+            return False
+        try:
+            fresh = build_index()
+        except (OSError, ValueError) as e:
+            if current is None:
+                raise
+            _failed_version = version
+            logger.warning("Catalog reload failed (%s), keeping version %s", e, current.version)
+            return False
+        _index = fresh
+    if current is not None:
+        logger.info("Catalog reloaded: version %s -> %s", current.version, fresh.version)
+    return True
+
+
+def _watch(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            reload_index()
+        except Exception:
+            logger.exception("Catalog watcher error")
+
+
+def start_catalog_watcher(interval: float = CATALOG_RELOAD_INTERVAL) -> None:
+    """Build the first snapshot now and keep it in sync with data/*.json.
+
+    Safe to call more than once (bot and web app share a process in main.py).
+    """
+    global _watcher
+    get_index()
+    if _watcher is not None or interval <= 0:
+        return
+    _watcher = threading.Thread(target=_watch, args=(interval,), name="catalog-watcher", daemon=True)
+    _watcher.start()
+
+
+def get_courses(category: str) -> List[Mapping[str, Any]]:
+    return list(get_index().categories.get(category, ()))
+
+
+def resolve_course_id(course_id: str) -> str:
+    return get_index().resolve(course_id)
+
+
+def get_course_by_id(course_id: str) -> Optional[Mapping[str, Any]]:
+    index = get_index()
+    return index.courses.get(index.resolve(course_id))
+
+
+def get_group_link(course_id: str) -> Optional[str]:
+    index = get_index()
+    return index.group_links.get(course_id) or index.group_links.get(index.resolve(course_id))
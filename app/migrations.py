@@ -0,0 +1,131 @@
+"""One-shot data migrations run from init_db.
+
+Processes starting together race for a marker document in the
+``migrations`` collection: the one that inserts it runs the migration and
+the others wait until it is marked done. The runner refreshes the marker's
+heartbeat, so if it dies mid-run another process takes over once the
+heartbeat goes stale. Migrations stay idempotent for that case.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MIGRATION_HEARTBEAT = 5.0
+MIGRATION_STALE = 30.0
+
+logger = logging.getLogger(__name__)
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def _claim(markers, name: str) -> bool:
+    now = datetime.utcnow()
+    try:
+        await markers.insert_one(
+            {"_id": name, "status": "running", "owner": _OWNER, "started_at": now, "heartbeat_at": now}
+        )
+        return True
+    except DuplicateKeyError:
+        pass
+    res = await markers.update_one(
+        {"_id": name, "status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=MIGRATION_STALE)}},
+        {"$set": {"owner": _OWNER, "heartbeat_at": now}},
+    )
+    if res.modified_count:
+        logger.warning("Taking over migration %s from a stalled run", name)
+        return True
+    return False
+
+
+async def _heartbeat(markers, name: str) -> None:
+    while True:
+        await asyncio.sleep(MIGRATION_HEARTBEAT)
+        await markers.update_one(
+            {"_id": name, "owner": _OWNER}, {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+
+
+async def run_once(db, name: str, migrate: Callable[[], Awaitable[int]]) -> None:
+    markers = db.migrations
+    while not await _claim(markers, name):
+        marker = await markers.find_one({"_id": name})
+        # Markers written before claims existed have no status.
+        if marker is not None and marker.get("status", "done") == "done":
+            return
+        if marker is not None:
+            await asyncio.sleep(MIGRATION_HEARTBEAT)
+    heartbeat = asyncio.create_task(_heartbeat(markers, name))
+    try:
+        result = await migrate()
+    except BaseException:
+        # Let the next process (or startup) try again.
+        await markers.delete_one({"_id": name, "owner": _OWNER})
+        raise
+    finally:
+        heartbeat.cancel()
+    await markers.update_one(
+        {"_id": name, "owner": _OWNER},
+        {"$set": {"status": "done", "done_at": datetime.utcnow(), "result": result}},
+    )
+
+
+async def bulk_upsert(collection, ops) -> None:
+    """Unordered bulk_write that ignores duplicate-key errors: a concurrent
+    run upserting the same row first is not a failure."""
+    try:
+        await collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        if e.details.get("writeConcernErrors"):
+            raise
+
+
+async def dedupe_users(db) -> int:
+    """Merge users sharing a telegram_id into one document.
+
+    The old find-then-insert registration could create duplicates, which
+    would make building the unique telegram_id index fail. Profile fields
+    come from the most recently active copy that has them; embedded arrays
+    not yet moved to their own collections are concatenated. Works on the
+    raw collection because it has to run before init_beanie.
+    """
+    users = db.users
+    removed = 0
+    pipeline = [
+        {"$group": {"_id": "$telegram_id", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]
+    async for group in users.aggregate(pipeline, allowDiskUse=True):
+        docs = await users.find({"_id": {"$in": group["ids"]}}).sort(
+            [("last_active", DESCENDING), ("registered_at", ASCENDING)]
+        ).to_list(length=None)
+        keep, rest = docs[0], docs[1:]
+        fields = {}
+        for field in ("full_name", "phone", "email", "study_year", "specialization"):
+            if not keep.get(field):
+                value = next((d[field] for d in rest if d.get(field)), None)
+                if value:
+                    fields[field] = value
+        registered = [d["registered_at"] for d in docs if d.get("registered_at")]
+        if registered:
+            fields["registered_at"] = min(registered)
+        update = {"$set": fields} if fields else {}
+        for field in ("notifications", "courses"):
+            extra = [item for d in rest for item in d.get(field) or []]
+            if extra:
+                update.setdefault("$push", {})[field] = {"$each": extra}
+        if update:
+            await users.update_one({"_id": keep["_id"]}, update)
+        await users.delete_many({"_id": {"$in": [d["_id"] for d in rest]}})
+        removed += len(rest)
+    if removed:
+        logger.warning("Merged %s duplicate user document(s) before indexing telegram_id", removed)
+    return removed
@@ -1,23 +1,56 @@
-from typing import List, Optional, Literal
+import os
+from typing import Any, Dict, List, Optional, Literal
 from datetime import datetime
 from beanie import Document
-from pydantic import BaseModel, Field
+from pydantic import Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
+# Notifications expire after this many days (TTL index on timestamp).
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "180"))
+# Seconds an accepted webhook update_id is remembered (TTL of seen_updates).
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "3600"))
 
-class CourseEnrollment(BaseModel):
+
+class Enrollment(Document):
+    telegram_id: int
     course_id: str
     approval_status: Literal["pending", "approved", "rejected"] = "pending"
     payment_method: Literal["sham", "haram"]
     payment_receipt: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "enrollments"
+        indexes = [
+            IndexModel([("telegram_id", ASCENDING), ("course_id", ASCENDING)], name="student_course", unique=True),
+            # Matches the pending page's full sort, tie-breakers included, so
+            # pages are index range scans with no in-memory SORT.
+            IndexModel(
+                [("approval_status", ASCENDING), ("created_at", ASCENDING), ("telegram_id", ASCENDING), ("course_id", ASCENDING)],
+                name="status_created_student_course",
+            ),
+            IndexModel([("course_id", ASCENDING), ("approval_status", ASCENDING)], name="course_status"),
+        ]
 
 
-class Notification(BaseModel):
+class Notification(Document):
     student_id: int
     type: str
     message: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+    class Settings:
+        name = "notifications"
+        indexes = [
+            IndexModel([("student_id", ASCENDING), ("timestamp", DESCENDING)], name="student_timestamp"),
+            IndexModel(
+                [("timestamp", ASCENDING)],
+                name="timestamp_ttl",
+                expireAfterSeconds=NOTIFICATION_RETENTION_DAYS * 24 * 3600,
+            ),
+        ]
+
 
 class User(Document):
     telegram_id: int
@@ -28,8 +61,102 @@ class User(Document):
     specialization: Optional[str] = None
     registered_at: datetime = Field(default_factory=datetime.utcnow)
     last_active: datetime = Field(default_factory=datetime.utcnow)
-    courses: List[CourseEnrollment] = Field(default_factory=list)
-    notifications: List[Notification] = Field(default_factory=list)
 
     class Settings:
         name = "users"
+        indexes = [
+            IndexModel([("telegram_id", ASCENDING)], name="telegram_id", unique=True),
+            IndexModel([("registered_at", ASCENDING)], name="registered_at"),
+            IndexModel([("last_active", ASCENDING)], name="last_active"),
+        ]
+
+
+class BroadcastJob(Document):
+    text: str
+    source: Literal["bot", "web"] = "bot"
+    status: Literal["running", "paused", "cancelled", "done"] = "running"
+    # Recipients are walked in telegram_id order; every id <= last_telegram_id
+    # has been handled, so a resumed job starts right after it.
+    last_telegram_id: int = 0
+    # First FAILED_IDS_SAMPLE failed recipients (app/broadcast.py); ``failed``
+    # counts all of them.
+    failed_ids: List[int] = Field(default_factory=list)
+    sent: int = 0
+    failed: int = 0
+    failures: Dict[str, int] = Field(default_factory=dict)
+    admin_chat_id: Optional[int] = None
+    progress_message_id: Optional[int] = None
+    # Process running the job; it refreshes heartbeat_at at every checkpoint
+    # and another process may take the job over once that goes stale.
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "broadcast_jobs"
+        indexes = [
+            IndexModel([("status", ASCENDING)], name="status"),
+        ]
+
+
+class Lease(Document):
+    """Time-limited ownership of a singleton role (see app/leader.py)."""
+
+    name: str
+    owner: str
+    expires_at: datetime
+
+    class Settings:
+        name = "leases"
+        indexes = [
+            IndexModel([("name", ASCENDING)], name="name", unique=True),
+        ]
+
+
+class SendBudget(Document):
+    """Next free send slot of a bot-wide rate limit (see app/broadcast.py)."""
+
+    name: str
+    # Unix time; shared by every process, so it is wall-clock time.
+    next_at: float = 0.0
+
+    class Settings:
+        name = "rate_limits"
+        indexes = [
+            IndexModel([("name", ASCENDING)], name="name", unique=True),
+        ]
+
+
+class QueuedUpdate(Document):
+    """Raw webhook update waiting for the process that owns the bot."""
+
+    update_id: int
+    payload: Dict[str, Any]
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "bot_inbox"
+        indexes = [
+            IndexModel([("update_id", ASCENDING)], name="update_id", unique=True),
+        ]
+
+
+class SeenUpdate(Document):
+    """update_id claimed, then accepted, by some instance (see app/dedup.py)."""
+
+    update_id: int
+    # False while the claiming instance is still accepting the update.
+    accepted: bool = True
+    seen_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "seen_updates"
+        indexes = [
+            IndexModel([("update_id", ASCENDING)], name="update_id", unique=True),
+            IndexModel(
+                [("seen_at", ASCENDING)],
+                name="seen_at_ttl",
+                expireAfterSeconds=UPDATE_DEDUP_WINDOW,
+            ),
+        ]
@@ -0,0 +1,48 @@
+import logging
+
+from pymongo import UpdateOne
+
+from .migrations import bulk_upsert
+from .models import Notification, User
+
+MIGRATION_BATCH = 200
+
+logger = logging.getLogger(__name__)
+
+
+async def notify(student_id: int, type: str, message: str) -> None:
+    await Notification(student_id=student_id, type=type, message=message).insert()
+
+
+async def migrate_embedded_notifications() -> int:
+    """Move ``users.notifications`` arrays into the notifications collection.
+
+    Copies are upserts keyed on (student_id, timestamp, type, message), so a
+    run interrupted between the copy and the ``$unset`` can simply be run
+    again without duplicating anything.
+    """
+    users = User.get_motor_collection()
+    target = Notification.get_motor_collection()
+    moved = 0
+    cursor = users.find(
+        {"notifications": {"$exists": True}},
+        projection={"telegram_id": 1, "notifications": 1},
+        batch_size=MIGRATION_BATCH,
+    )
+    async for doc in cursor:
+        ops = []
+        for n in doc.get("notifications") or []:
+            key = {
+                "student_id": n.get("student_id", doc.get("telegram_id")),
+                "timestamp": n.get("timestamp"),
+                "type": n.get("type"),
+                "message": n.get("message"),
+            }
+            ops.append(UpdateOne(key, {"$setOnInsert": key}, upsert=True))
+        if ops:
+            await bulk_upsert(target, ops)
+            moved += len(ops)
+        await users.update_one({"_id": doc["_id"]}, {"$unset": {"notifications": ""}})
+    if moved:
+        logger.info("Moved %s embedded notifications to their own collection", moved)
+    return moved
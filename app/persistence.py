@@ -0,0 +1,211 @@
+"""PTB persistence in MongoDB for user_data and conversation states.
+
+Carts, pending payment state and half-finished registrations used to live
+only in process memory and were lost on every deploy. PTB hands changed
+entries to the ``update_*`` methods every ``update_interval`` seconds and
+on shutdown; here they are only marked dirty, then written together as one
+unordered bulk_write per collection. Entries whose content did not change
+since the last write are skipped.
+
+Application.initialize() reads persisted data before post_init runs, so
+the database is connected lazily on first use.
+"""
+import asyncio
+import copy
+import logging
+import os
+from typing import Any, Dict, Optional, Set, Tuple
+
+from pymongo import DeleteOne, ReplaceOne
+from telegram.ext import BasePersistence, PersistenceInput
+
+from .db import get_client, init_db
+
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))
+
+logger = logging.getLogger(__name__)
+
+ConversationKey = Tuple[int, ...]
+ConversationDict = Dict[ConversationKey, object]
+
+_DELETED = object()
+
+
+def _conv_id(name: str, key: ConversationKey) -> str:
+    return f"{name}:{','.join(str(k) for k in key)}"
+
+
+class MongoPersistence(BasePersistence[Dict[str, Any], Dict[str, Any], Dict[str, Any]]):
+    def __init__(
+        self,
+        mongo_url: str,
+        db_name: str,
+        update_interval: float = PERSISTENCE_INTERVAL,
+        shard: Optional[Tuple[int, int]] = None,
+    ):
+        """``shard=(index, count)`` limits loading to users with
+        ``id % count == index``, for a bot worker that only sees those."""
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._mongo_url = mongo_url
+        self._db_name = db_name
+        self._shard = shard
+        self._user_data: Optional[Dict[int, Dict[str, Any]]] = None
+        self._conversations: Dict[str, ConversationDict] = {}
+        # Last content written per user, to skip no-op writes.
+        self._written: Dict[int, Dict[str, Any]] = {}
+        self._dirty_users: Dict[int, Any] = {}
+        self._dirty_convs: Dict[str, Tuple[str, ConversationKey, object]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._evicted: Set[int] = set()
+
+    async def _db(self):
+        if get_client() is None:
+            await init_db(self._mongo_url, self._db_name)
+        return get_client()[self._db_name]
+
+    # ---------- reads (cached after the first call) ----------
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        if self._user_data is None:
+            db = await self._db()
+            self._user_data = {}
+            query = {"_id": {"$mod": [self._shard[1], self._shard[0]]}} if self._shard else {}
+            async for doc in db.bot_user_data.find(query):
+                self._user_data[doc["_id"]] = doc.get("data") or {}
+            self._written = copy.deepcopy(self._user_data)
+        return copy.deepcopy(self._user_data)
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        if name not in self._conversations:
+            db = await self._db()
+            self._conversations[name] = {
+                tuple(doc["key"]): doc["state"]
+                async for doc in db.bot_conversations.find({"name": name})
+                # The user id is the last element of every conversation key.
+                if not self._shard or doc["key"][-1] % self._shard[1] == self._shard[0]
+            }
+        return dict(self._conversations[name])
+
+    async def get_chat_data(self) -> Dict[int, Dict[str, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    # ---------- writes (buffered, flushed in one batch) ----------
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        # An evicted entry that was not reloaded would overwrite the stored
+        # data with an empty dict.
+        if user_id in self._evicted or self._written.get(user_id) == data:
+            return
+        self._dirty_users[user_id] = copy.deepcopy(data)
+        await self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty_users[user_id] = _DELETED
+        await self._schedule_flush()
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        conv = self._conversations.setdefault(name, {})
+        if conv.get(key) == new_state and new_state is not None:
+            return
+        if new_state is None:
+            conv.pop(key, None)
+        else:
+            conv[key] = new_state
+        self._dirty_convs[_conv_id(name, key)] = (name, key, new_state)
+        await self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    def user_data_evicted(self, user_id: int) -> None:
+        """The application dropped ``user_id``'s data from memory only
+        (app/idle.py); reload it when the user is back."""
+        self._evicted.add(user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        # Single writer: the in-memory copy is always the newest, unless it
+        # was evicted. PTB calls this before any handler sees the update.
+        if user_id not in self._evicted:
+            return
+        self._evicted.discard(user_id)
+        data = self._dirty_users.get(user_id)
+        if data is None:
+            db = await self._db()
+            doc = await db.bot_user_data.find_one({"_id": user_id})
+            data = (doc.get("data") or {}) if doc else None
+        if data and data is not _DELETED:
+            user_data.update(copy.deepcopy(data))
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[str, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[str, Any]) -> None:
+        pass
+
+    async def _schedule_flush(self) -> None:
+        # PTB calls update_* for every changed entry back to back; the first
+        # call starts one flush that runs after all of them have queued.
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_dirty())
+
+    async def _flush_dirty(self) -> None:
+        await asyncio.sleep(0)
+        # Entries marked dirty while a batch is in flight go out in the next.
+        while self._dirty_users or self._dirty_convs:
+            if not await self._write_batch():
+                break
+
+    async def _write_batch(self) -> bool:
+        users, self._dirty_users = self._dirty_users, {}
+        convs, self._dirty_convs = self._dirty_convs, {}
+        try:
+            db = await self._db()
+            if users:
+                ops = [
+                    DeleteOne({"_id": uid}) if data is _DELETED else ReplaceOne({"_id": uid}, {"_id": uid, "data": data}, upsert=True)
+                    for uid, data in users.items()
+                ]
+                await db.bot_user_data.bulk_write(ops, ordered=False)
+                for uid, data in users.items():
+                    if data is _DELETED:
+                        self._written.pop(uid, None)
+                    else:
+                        self._written[uid] = data
+            if convs:
+                ops = [
+                    DeleteOne({"_id": cid})
+                    if state is None
+                    else ReplaceOne({"_id": cid}, {"_id": cid, "name": name, "key": list(key), "state": state}, upsert=True)
+                    for cid, (name, key, state) in convs.items()
+                ]
+                await db.bot_conversations.bulk_write(ops, ordered=False)
+        except Exception:
+            logger.exception("Persistence flush failed; will retry with the next batch")
+            for uid, data in users.items():
+                self._dirty_users.setdefault(uid, data)
+            for cid, item in convs.items():
+                self._dirty_convs.setdefault(cid, item)
+            return False
+        return True
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._dirty_users or self._dirty_convs:
+            await self._flush_dirty()
@@ -0,0 +1,87 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from .models import Enrollment, User
+
+PAGE_SIZE = 20
+
+# (created_at, telegram_id, course_id) of the last row on the previous page
+PendingCursor = Tuple[datetime, int, str]
+
+
+async def pending_enrollments_page(after: Optional[PendingCursor] = None, limit: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    """One page of pending enrollments, oldest first.
+
+    A range scan on the (approval_status, created_at, telegram_id,
+    course_id) index, which also supplies the order, followed by one $in
+    lookup for the names of the students on the page.
+    """
+    query: Dict[str, Any] = {"approval_status": "pending"}
+    if after:
+        ts, tid, cid = after
+        query["$or"] = [
+            {"created_at": {"$gt": ts}},
+            {"created_at": ts, "telegram_id": {"$gt": tid}},
+            {"created_at": ts, "telegram_id": tid, "course_id": {"$gt": cid}},
+        ]
+    cursor = (
+        Enrollment.get_motor_collection()
+        .find(query, {"_id": 0, "telegram_id": 1, "course_id": 1, "created_at": 1})
+        .sort([("created_at", ASCENDING), ("telegram_id", ASCENDING), ("course_id", ASCENDING)])
+        .limit(limit)
+    )
+    rows = await cursor.to_list(length=limit)
+    if rows:
+        ids = list({r["telegram_id"] for r in rows})
+        names = {
+            u["telegram_id"]: u.get("full_name")
+            async for u in User.get_motor_collection().find(
+                {"telegram_id": {"$in": ids}}, {"_id": 0, "telegram_id": 1, "full_name": 1}
+            )
+        }
+        for r in rows:
+            r["full_name"] = names.get(r["telegram_id"])
+    return rows
+
+
+def pending_cursor(row: Dict[str, Any]) -> PendingCursor:
+    return (row["created_at"], row["telegram_id"], row["course_id"])
+
+
+async def students_page(
+    after: Optional[ObjectId] = None,
+    before: Optional[ObjectId] = None,
+    limit: int = PAGE_SIZE,
+) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """Keyset page of students ordered by _id: (rows, has_prev, has_next).
+
+    Each page is a single range scan on the _id index that returns only the
+    fields the list buttons need.
+    """
+    if before is not None:
+        query, direction = {"_id": {"$lt": before}}, DESCENDING
+    elif after is not None:
+        query, direction = {"_id": {"$gt": after}}, ASCENDING
+    else:
+        query, direction = {}, ASCENDING
+    cursor = (
+        User.get_motor_collection()
+        .find(query, {"telegram_id": 1, "full_name": 1})
+        .sort("_id", direction)
+        .limit(limit + 1)
+    )
+    rows = await cursor.to_list(length=limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, after is not None, has_more
+
+
+async def count_students() -> int:
+    # Collection metadata count: O(1), unlike a count_documents({}) scan.
+    return await User.get_motor_collection().estimated_document_count()
@@ -0,0 +1,232 @@
+"""Append-only local log of accepted webhook updates.
+
+The webhook used to answer 200 as soon as an update sat in PTB's in-memory
+queue, so a crash or deploy lost everything still queued (payment receipts
+included). Now the update is appended to a segment file and fsynced before
+the 200; the update processor appends a ``done`` record once its handlers
+have finished. On startup every update without a ``done`` record is handed
+back for replay.
+
+Appends waiting at the same time share one write+fsync (group commit).
+Segments roll over at UPDATE_LOG_SEGMENT_BYTES; the oldest closed
+segments are deleted once all of their updates are done. Each line is one JSON object:
+``{"update": <payload>}`` or ``{"done": <update_id>}``; a torn last line
+left by a crash is skipped.
+
+Only one process may use a directory at a time: ``open`` waits for an
+exclusive lock on its LOCK file, held until ``close``. With leader
+election an incoming leader therefore replays only after the outgoing one
+has written out and closed its log, instead of both replaying and
+deleting each other's segments.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+UPDATE_LOG_DIR = os.getenv("UPDATE_LOG_DIR", "data/update_log")
+UPDATE_LOG_SEGMENT_BYTES = int(os.getenv("UPDATE_LOG_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+# How long the writer waits for more appends before each fsync.
+UPDATE_LOG_FSYNC_INTERVAL = float(os.getenv("UPDATE_LOG_FSYNC_INTERVAL", "0.002"))
+UPDATE_LOG_LOCK_POLL = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class UpdateLog:
+    def __init__(
+        self,
+        directory: str = UPDATE_LOG_DIR,
+        segment_bytes: int = UPDATE_LOG_SEGMENT_BYTES,
+        fsync_interval: float = UPDATE_LOG_FSYNC_INTERVAL,
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._lock_file = None
+        self._seq = 0
+        # update_id -> segment holding its record (None while buffered);
+        # segment -> updates in it not done yet
+        self._pending: Dict[int, Optional[int]] = {}
+        self._live: Dict[int, int] = {}
+        self._buffer: List[str] = []
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+        # update_id -> completion of its not yet durable append
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _segment(self, seq: int) -> Path:
+        return self.directory / f"{seq:012d}.log"
+
+    def _segments(self) -> List[int]:
+        return sorted(int(p.stem) for p in self.directory.glob("*.log") if p.stem.isdigit())
+
+    async def _lock(self) -> None:
+        fh = open(self.directory / "LOCK", "a")
+        waiting = False
+        try:
+            while True:
+                try:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if not waiting:
+                        logger.warning("Waiting for another process to close the update log in %s", self.directory)
+                        waiting = True
+                    await asyncio.sleep(UPDATE_LOG_LOCK_POLL)
+        except BaseException:
+            fh.close()
+            raise
+        self._lock_file = fh
+
+    async def open(self) -> List[Dict[str, Any]]:
+        """Open the log and return the updates that were never marked done,
+        oldest first. They are carried into a fresh segment, so the old
+        segments can go."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        await self._lock()
+        old = self._segments()
+        unfinished: Dict[int, Dict[str, Any]] = {}
+        for seq in old:
+            with open(self._segment(seq), encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping torn record in update log segment %s", seq)
+                        continue
+                    if "done" in record:
+                        unfinished.pop(record["done"], None)
+                    else:
+                        unfinished[record["update"]["update_id"]] = record["update"]
+
+        self._seq = (old[-1] + 1) if old else 1
+        self._file = open(self._segment(self._seq), "a", encoding="utf-8")
+        if unfinished:
+            self._file.write("".join(json.dumps({"update": p}) + "\n" for p in unfinished.values()))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._pending = {uid: self._seq for uid in unfinished}
+        self._live = {self._seq: len(unfinished)}
+        _fsync_dir(self.directory)
+        for seq in old:
+            self._segment(seq).unlink()
+        if unfinished:
+            logger.warning("Replaying %s update(s) left unfinished in the update log", len(unfinished))
+        return list(unfinished.values())
+
+    async def append(self, payload: Dict[str, Any]) -> None:
+        """Return once ``payload`` is durably on disk."""
+        if self._closed:
+            raise RuntimeError("update log is closed")
+        uid = payload["update_id"]
+        if uid in self._pending:
+            # Already logged, or being logged by an earlier delivery whose
+            # fsync has to finish before this one may be acknowledged.
+            inflight = self._inflight.get(uid)
+            if inflight is not None:
+                await asyncio.shield(inflight)
+            return
+        self._pending[uid] = None
+        waiter = asyncio.get_running_loop().create_future()
+        self._inflight[uid] = waiter
+        self._buffer.append(json.dumps({"update": payload}) + "\n")
+        self._waiters.append((uid, waiter))
+        self._kick()
+        await asyncio.shield(waiter)
+
+    def mark_done(self, update_id: int) -> None:
+        if self._closed:
+            return
+        seq = self._pending.pop(update_id, None)
+        if seq is None:
+            return
+        self._live[seq] -= 1
+        # Not awaited: losing a done record only means one extra replay.
+        self._buffer.append(json.dumps({"done": update_id}) + "\n")
+        self._kick()
+
+    def _kick(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def _write(self, data: str) -> None:
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._buffer:
+            await asyncio.sleep(self.fsync_interval)
+            if self._file.tell() >= self.segment_bytes:
+                self._roll()
+            lines, self._buffer = self._buffer, []
+            waiters, self._waiters = self._waiters, []
+            # Segments are assigned here, once it is known which file the
+            # batch goes to.
+            for uid, _ in waiters:
+                self._pending[uid] = self._seq
+            self._live[self._seq] += len(waiters)
+            try:
+                await loop.run_in_executor(None, self._write, "".join(lines))
+            except Exception as exc:
+                logger.exception("Writing the update log failed")
+                self._live[self._seq] -= len(waiters)
+                for uid, waiter in waiters:
+                    # Not durable: let Telegram's redelivery append it again.
+                    self._pending.pop(uid, None)
+                    self._inflight.pop(uid, None)
+                    if not waiter.done():
+                        waiter.set_exception(exc)
+                continue
+            for uid, waiter in waiters:
+                self._inflight.pop(uid, None)
+                if not waiter.done():
+                    waiter.set_result(None)
+            self._collect()
+
+    def _roll(self) -> None:
+        self._file.close()
+        self._seq += 1
+        self._file = open(self._segment(self._seq), "a", encoding="utf-8")
+        self._live[self._seq] = 0
+
+    def _collect(self) -> None:
+        # Oldest first, stopping at the first segment still needed: later
+        # segments hold the done records for updates in earlier ones.
+        for seq in sorted(self._live):
+            if seq >= self._seq or self._live[seq]:
+                break
+            del self._live[seq]
+            try:
+                self._segment(seq).unlink()
+            except FileNotFoundError:
+                pass
+
+    async def close(self) -> None:
+        """Write out what is buffered; later appends raise and later
+        done records are ignored (those updates are replayed)."""
+        self._closed = True
+        if self._writer is not None:
+            await self._writer
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            # Closing the descriptor releases the lock.
+            self._lock_file.close()
+            self._lock_file = None
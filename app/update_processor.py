@@ -0,0 +1,71 @@
+"""Concurrent update processing that keeps each user's updates in order.
+
+With PTB's default sequential processing one student's slow Mongo write or
+Telegram call delays everybody. Here updates of different users run in
+parallel (up to ``max_concurrent_updates``) while updates of the same user
+(or chat, when there is no user) wait for each other, so conversation
+states and ``user_data`` only ever see one update at a time per user.
+Once an update's handlers have run it is marked done in the update log,
+if there is one.
+"""
+import asyncio
+import os
+from typing import TYPE_CHECKING, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+if TYPE_CHECKING:
+    from .update_log import UpdateLog
+
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    if isinstance(update, Update):
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        if update.effective_chat:
+            return ("chat", update.effective_chat.id)
+    return None
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """PTB's ``process_update`` bounds concurrency with its semaphore; the
+    per-key lock is taken inside it, so an update waiting for its user's
+    earlier one holds a slot meanwhile."""
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES, update_log: Optional["UpdateLog"] = None):
+        super().__init__(max_concurrent_updates)
+        self.update_log = update_log
+        # key -> (lock, number of updates holding or waiting for it)
+        self._locks: Dict[Hashable, list] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        try:
+            key = update_key(update)
+            if key is None:
+                await coroutine
+                return
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    await coroutine
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+        finally:
+            # Also after a failure: replaying an update that crashes its
+            # handler would only crash it again.
+            if self.update_log is not None and isinstance(update, Update):
+                self.update_log.mark_done(update.update_id)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
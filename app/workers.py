@@ -0,0 +1,177 @@
+"""Optional multi-process bot: the web front end shards updates to workers.
+
+With BOT_WORKERS=N (N > 0) the webhook endpoint no longer runs the bot in
+its own event loop. It routes each update by ``user_id % N`` over a
+per-worker multiprocessing queue to one of N processes, each running its
+own Application from ``build_application``. A user always lands on the
+same worker, so per-user ordering and user_data stay as with one process,
+while different users use all cores. A worker that dies or stops draining
+its queue only affects its own shard: its updates get a 503 (Telegram
+retries them) and the supervisor restarts it.
+
+The front end owns the update log (app/update_log.py): an update is
+appended before it is queued to a worker, and workers report finished
+updates back over a shared queue so the front end can mark them done.
+Updates lost with a crashed worker are replayed on the next start.
+
+Worker 0 resumes the bot's broadcast jobs, also after a restart. The
+jobs of the worker it replaces stay claimed by that worker until their
+heartbeat goes stale (app/broadcast.py), so a restart takes them over once
+instead of running them twice.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+from contextlib import suppress
+from typing import Any, Callable, Dict, List, Optional
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+SUPERVISE_INTERVAL = 5.0
+
+logger = logging.getLogger(__name__)
+
+_ctx = mp.get_context("spawn")
+
+
+def update_user_id(payload: Dict[str, Any]) -> Optional[int]:
+    """Sender id from a raw update, without building PTB objects."""
+    for key, value in payload.items():
+        if key != "update_id" and isinstance(value, dict):
+            sender = value.get("from") or value.get("user")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+            chat = value.get("chat")
+            if isinstance(chat, dict) and "id" in chat:
+                return chat["id"]
+    return None
+
+
+class _DoneReporter:
+    """Takes the update log's place in a worker's update processor."""
+
+    def __init__(self, done: "mp.Queue"):
+        self._done = done
+
+    def mark_done(self, update_id: int) -> None:
+        # Losing one only means an extra replay, as with the log itself.
+        with suppress(Exception):
+            self._done.put_nowait(update_id)
+
+
+def _worker_main(index: int, count: int, updates: "mp.Queue", done: "mp.Queue") -> None:
+    from telegram import Update
+
+    from app.config import load_config
+    from bot import build_application, setup_logging
+
+    cfg = load_config()
+    setup_logging(cfg.DEBUG)
+
+    async def run() -> None:
+        application = build_application(cfg, shard=(index, count), update_log=_DoneReporter(done))
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                payload = await loop.run_in_executor(None, updates.get)
+                if payload is None:
+                    break
+                await application.update_queue.put(Update.de_json(payload, application.bot))
+        finally:
+            with suppress(Exception):
+                await application.stop()
+            with suppress(Exception):
+                await application.shutdown()
+            if application.post_shutdown:
+                with suppress(Exception):
+                    await application.post_shutdown(application)
+
+    asyncio.run(run())
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        count: int,
+        queue_size: int = WORKER_QUEUE_SIZE,
+        on_done: Optional[Callable[[int], None]] = None,
+    ):
+        self.count = count
+        self._queues: List["mp.Queue"] = [_ctx.Queue(queue_size) for _ in range(count)]
+        self._done: "mp.Queue" = _ctx.Queue()
+        self._on_done = on_done
+        self._procs: List[Optional[mp.Process]] = [None] * count
+        self._supervisor: Optional[asyncio.Task] = None
+        self._done_pump: Optional[asyncio.Task] = None
+
+    def _spawn(self, index: int) -> None:
+        proc = _ctx.Process(
+            target=_worker_main, args=(index, self.count, self._queues[index], self._done), name=f"bot-worker-{index}", daemon=True
+        )
+        proc.start()
+        self._procs[index] = proc
+        logger.info("Started bot worker %s (pid %s)", index, proc.pid)
+
+    def start(self) -> None:
+        for i in range(self.count):
+            self._spawn(i)
+        self._supervisor = asyncio.create_task(self._supervise())
+        self._done_pump = asyncio.create_task(self._pump_done())
+
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for i, proc in enumerate(self._procs):
+                if proc is not None and not proc.is_alive():
+                    logger.error("Bot worker %s exited with %s; restarting", i, proc.exitcode)
+                    self._spawn(i)
+
+    async def _pump_done(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            update_id = await loop.run_in_executor(None, self._done.get)
+            if update_id is None:
+                break
+            if self._on_done is not None:
+                self._on_done(update_id)
+
+    def dispatch(self, payload: Dict[str, Any]) -> bool:
+        """Queue an update on its user's worker; False if that worker is
+        down or backed up."""
+        uid = update_user_id(payload)
+        index = (uid if uid is not None else payload.get("update_id", 0)) % self.count
+        proc = self._procs[index]
+        if proc is None or not proc.is_alive():
+            return False
+        try:
+            self._queues[index].put_nowait(payload)
+        except queue.Full:
+            logger.warning("Bot worker %s queue full; rejecting update", index)
+            return False
+        return True
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for q in self._queues:
+            with suppress(Exception):
+                q.put_nowait(None)
+        loop = asyncio.get_running_loop()
+        for proc in self._procs:
+            if proc is None:
+                continue
+            await loop.run_in_executor(None, proc.join, timeout)
+            if proc.is_alive():
+                proc.terminate()
+        if self._done_pump is not None:
+            # After the joins, so done records from the last updates are in.
+            self._done.put(None)
+            with suppress(Exception):
+                await self._done_pump
+            self._done_pump = None
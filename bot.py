@@ -1,11 +1,21 @@
 import asyncio
 import logging
 import os
+from typing import Optional, Tuple
 
-from telegram.ext import Application, ConversationHandler, CallbackQueryHandler, MessageHandler, CommandHandler, filters
+from telegram import Update
+from telegram.ext import Application, ContextTypes, ConversationHandler, CallbackQueryHandler, MessageHandler, CommandHandler, TypeHandler, filters
 
+from app import activity, idle
 from app.config import load_config
+from app.context import BotContext, LOOKUP_STATS_GROUP, lookup_stats_handler
 from app.db import init_db
+from app.persistence import MongoPersistence
+from app.update_log import UpdateLog
+from app.update_processor import KeyedUpdateProcessor
+from app.loaders import start_catalog_watcher
+from app.keyboards import warm_keyboards
+from app.broadcast import bot_sender, resume_jobs
 from app.handlers.registration import get_handler as registration_handler
 from app.handlers.courses import get_handlers as courses_handlers
 from app.handlers.payment import get_handlers as payment_handlers
@@ -16,6 +26,7 @@ from app.handlers.admin import (
     admin_msg_select_cb,
     capture_messages,
     cancel_cmd,
+    direct_message_timeout,
 )
 
 
@@ -27,15 +38,45 @@ def setup_logging(debug: bool):
     )
 
 
-def build_application(cfg, init_db_on_startup: bool = True):
+def build_application(
+    cfg,
+    init_db_on_startup: bool = True,
+    shard: Optional[Tuple[int, int]] = None,
+    update_log: Optional[UpdateLog] = None,
+):
+    """``shard=(index, count)`` builds one of several worker applications:
+    persistence loads only that shard's users and only worker 0 resumes
+    the bot's broadcast jobs (the web process resumes its own)."""
     async def post_init(app: Application):
         if init_db_on_startup:
             await init_db(cfg.MONGODB_URL, cfg.MONGODB_DB_NAME)
+        start_catalog_watcher()
+        warm_keyboards()
         app.bot_data["ADMIN_ID"] = cfg.TELEGRAM_ADMIN_ID
         app.bot_data["SHAM"] = cfg.SHAM_CASH_NUMBER
         app.bot_data["HARAM"] = cfg.HARAM_NUMBER
+        if not shard or shard[0] == 0:
+            await resume_jobs(bot_sender(app.bot), app.bot, source="bot")
+        activity.start()
+        idle.start(app)
+
+    async def post_shutdown(app: Application):
+        await activity.stop()
+
+    application = (
+        Application.builder()
+        .token(cfg.TELEGRAM_BOT_TOKEN)
+        .context_types(ContextTypes(context=BotContext))
+        .persistence(MongoPersistence(cfg.MONGODB_URL, cfg.MONGODB_DB_NAME, shard=shard))
+        .concurrent_updates(KeyedUpdateProcessor(update_log=update_log))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
-    application = Application.builder().token(cfg.TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+    # Records every sender's last_active before any handler runs
+    application.add_handler(activity.activity_handler, group=activity.ACTIVITY_GROUP)
+    application.add_handler(idle.idle_handler, group=idle.IDLE_GROUP)
 
     # Handlers - Order matters! More specific handlers first
     application.add_handler(registration_handler())
@@ -49,10 +90,14 @@ def build_application(cfg, init_db_on_startup: bool = True):
             AWAITING_DIRECT_MESSAGE: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, capture_messages),
             ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, direct_message_timeout)],
         },
         fallbacks=[CommandHandler("cancel", cancel_cmd)],
         per_user=True,
         per_chat=False,
+        name="direct_message_conversation",
+        persistent=True,
+        conversation_timeout=idle.CONVERSATION_TIMEOUT,
     )
     application.add_handler(direct_message_handler)
 
@@ -67,6 +112,8 @@ def build_application(cfg, init_db_on_startup: bool = True):
         application.add_handler(h)
     # Admin catch-all text handler LAST
     application.add_handler(admin_catchall_handler())
+    # Per-update User lookup/round-trip counts (DEBUG)
+    application.add_handler(lookup_stats_handler, group=LOOKUP_STATS_GROUP)
 
     return application
 
@@ -87,10 +134,10 @@ def main():
             port=cfg.WEBAPP_PORT,
             url_path=cfg.TELEGRAM_BOT_TOKEN,
             webhook_url=public_url,
-            drop_pending_updates=True,
+            drop_pending_updates=False,
         )
     else:
-        app.run_polling(drop_pending_updates=True)
+        app.run_polling(drop_pending_updates=False)
 
 
 if __name__ == "__main__":
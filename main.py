@@ -1,15 +1,31 @@
+import asyncio
+import logging
 import os
 from contextlib import suppress
 
 from fastapi import Request, Response
-from telegram import Update
+from telegram import Bot, Update
 
 from windserve_app.main import app
 
 from app.config import load_config
+from app.broadcast import stop_jobs, watch_jobs
+from app.db import init_db
+from app.dedup import deduplicator
+from app.leader import LEADER_ELECTION, MongoLease, drain_inbox, push_update
+from app.update_log import UpdateLog
+from app.workers import BOT_WORKERS, WorkerPool
+from windserve_app import telegram_client as tg
 from bot import build_application, setup_logging
 
 _tg_app = None
+_workers = None
+_lease_task = None
+_inbox_task = None
+_jobs_task = None
+_update_log = None
+
+logger = logging.getLogger(__name__)
 
 
 def _normalize_webhook_url(url: str) -> str:
@@ -25,12 +41,36 @@ def _normalize_webhook_url(url: str) -> str:
 
 @app.post("/bot")
 async def telegram_webhook(request: Request) -> Response:
-    if _tg_app is None:
+    if not LEADER_ELECTION and _workers is None and _tg_app is None:
         return Response(status_code=503)
     payload = await request.json()
-    update = Update.de_json(payload, _tg_app.bot)
-    await _tg_app.update_queue.put(update)
-    return Response(status_code=200)
+    # Non-2xx (or an error) makes Telegram redeliver; an update id only
+    # counts as seen once the update has been accepted.
+    accepted = await deduplicator.accept(payload.get("update_id"), lambda: _accept_update(payload))
+    return Response(status_code=200 if accepted else 503)
+
+
+async def _accept_update(payload) -> bool:
+    if LEADER_ELECTION:
+        # Any web worker may receive the POST; the lease holder runs the bot.
+        await push_update(payload)
+        return True
+    try:
+        # On disk before the 200: after that Telegram will not resend it.
+        await _update_log.append(payload)
+    except OSError:
+        return False
+    if _workers is not None:
+        # Non-2xx makes Telegram redeliver, so a down or backed-up worker
+        # only delays its own shard.
+        return _workers.dispatch(payload)
+    await _tg_app.update_queue.put(Update.de_json(payload, _tg_app.bot))
+    return True
+
+
+@app.get("/bot/stats")
+async def telegram_webhook_stats() -> dict:
+    return {"duplicates_dropped": deduplicator.dropped}
 
 
 @app.on_event("startup")
@@ -52,27 +92,110 @@ async def _startup() -> None:
 
     print(f"Telegram webhook URL (set_webhook): {webhook_url}")
 
-    global _tg_app
-    _tg_app = build_application(cfg, init_db_on_startup=False)
+    if LEADER_ELECTION:
+        global _lease_task
+        await init_db(os.environ["MONGODB_URL"], os.environ["MONGODB_DB_NAME"])
+
+        async def on_elected() -> None:
+            global _inbox_task, _jobs_task
+            await _start_bot(cfg, webhook_url)
+            # Web workers only insert jobs; only the lease holder runs them.
+            # A previous leader may still be draining some of these; each
+            # job is claimed before it runs, so it is not sent twice.
+            _jobs_task = asyncio.create_task(watch_jobs(tg.send_text, source="web"))
+            _inbox_task = asyncio.create_task(drain_inbox(_handle_queued))
+
+        _lease_task = asyncio.create_task(MongoLease("telegram_bot").run(on_elected, _stop_bot))
+        return
+
+    await _start_bot(cfg, webhook_url)
+
+
+async def _handle_queued(payload) -> None:
+    if _update_log is None:
+        return
+    # Logged before the inbox entry is deleted.
+    await _update_log.append(payload)
+    if _workers is not None:
+        if not _workers.dispatch(payload):
+            raise RuntimeError("bot worker unavailable")
+    elif _tg_app is not None:
+        await _tg_app.update_queue.put(Update.de_json(payload, _tg_app.bot))
+
+
+async def _start_bot(cfg, webhook_url: str) -> None:
+    global _tg_app, _workers, _update_log
+    _update_log = UpdateLog()
+    # Waits for an outgoing leader to close the log before replaying it.
+    unfinished = await _update_log.open()
+
+    if BOT_WORKERS > 0:
+        _workers = WorkerPool(BOT_WORKERS, on_done=_update_log.mark_done)
+        _workers.start()
+        for payload in unfinished:
+            if not _workers.dispatch(payload):
+                logger.warning("Could not replay update %s; kept for the next start", payload.get("update_id"))
+        async with Bot(cfg.TELEGRAM_BOT_TOKEN) as bot:
+            await bot.set_webhook(url=webhook_url, drop_pending_updates=False)
+        return
+
+    _tg_app = build_application(cfg, init_db_on_startup=False, update_log=_update_log)
     await _tg_app.initialize()
+    # run_polling/run_webhook call post_init themselves; here we drive the
+    # application manually, so call it explicitly (bot_data, job resume).
+    if _tg_app.post_init:
+        await _tg_app.post_init(_tg_app)
     await _tg_app.start()
+    for payload in unfinished:
+        await _tg_app.update_queue.put(Update.de_json(payload, _tg_app.bot))
 
+    # Updates Telegram still holds were never acknowledged; let them come.
     await _tg_app.bot.set_webhook(
         url=webhook_url,
-        drop_pending_updates=True,
+        drop_pending_updates=False,
     )
 
 
 @app.on_event("shutdown")
 async def _shutdown() -> None:
-    global _tg_app
-    if _tg_app is None:
+    global _lease_task
+    if _lease_task is not None:
+        # Its cleanup stops the bot and releases the lease.
+        _lease_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _lease_task
+        _lease_task = None
         return
-    with suppress(Exception):
-        await _tg_app.stop()
-    with suppress(Exception):
-        await _tg_app.shutdown()
-    _tg_app = None
+    await _stop_bot()
+
+
+async def _stop_bot() -> None:
+    global _tg_app, _workers, _inbox_task, _jobs_task, _update_log
+    if _inbox_task is not None:
+        _inbox_task.cancel()
+        _inbox_task = None
+    if _jobs_task is not None:
+        _jobs_task.cancel()
+        _jobs_task = None
+    # Hands the claims back, so a new leader resumes the jobs without
+    # waiting for their heartbeats to go stale.
+    await stop_jobs()
+    if _workers is not None:
+        await _workers.stop()
+        _workers = None
+    if _tg_app is not None:
+        with suppress(Exception):
+            await _tg_app.stop()
+        with suppress(Exception):
+            await _tg_app.shutdown()
+        if _tg_app.post_shutdown:
+            with suppress(Exception):
+                await _tg_app.post_shutdown(_tg_app)
+        _tg_app = None
+    if _update_log is not None:
+        with suppress(Exception):
+            await _update_log.close()
+        _update_log = None
 
 
 if __name__ == "__main__":
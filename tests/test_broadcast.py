@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from beanie import init_beanie
+from telegram.error import Forbidden
+
+from app import broadcast
+from app.broadcast import MongoRateLimiter, start_job, stop_jobs, watch_jobs
+from app.models import BroadcastJob, SendBudget, User
+
+RATE = 50.0
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _init():
+    client = mongomock_motor.AsyncMongoMockClient()
+    await init_beanie(database=client["test"], document_models=[SendBudget])
+
+
+def test_processes_share_one_send_budget():
+    async def scenario():
+        await _init()
+        # One limiter per process; they only share the Mongo document.
+        processes = [MongoRateLimiter(RATE), MongoRateLimiter(RATE)]
+        sends = []
+
+        async def sender(limiter):
+            for _ in range(10):
+                await limiter.acquire()
+                sends.append(time.monotonic())
+
+        start = time.monotonic()
+        await asyncio.gather(*(sender(limiter) for limiter in processes for _ in range(4)))
+        return start, sends
+
+    start, sends = run(scenario())
+    assert len(sends) == 80
+    # 80 slots at 50/s take ~1.6 s in total, not ~0.8 s as with a budget each.
+    assert sends[-1] - start >= (80 - 1) / RATE - 0.1
+    window = [t for t in sends if t - start <= 1.0]
+    assert len(window) <= RATE + 2
+
+
+def test_backoff_in_one_process_delays_the_others():
+    async def scenario():
+        await _init()
+        throttled, other = MongoRateLimiter(RATE), MongoRateLimiter(RATE)
+        await throttled.acquire()
+        await throttled.backoff(0.3)
+        start = time.monotonic()
+        await other.acquire()
+        return time.monotonic() - start
+
+    assert run(scenario()) >= 0.25
+
+
+async def _init_jobs(users):
+    client = mongomock_motor.AsyncMongoMockClient()
+    await init_beanie(database=client["test"], document_models=[SendBudget, BroadcastJob, User])
+    for telegram_id in users:
+        await User(telegram_id=telegram_id, full_name="User", phone="0", email="u@example.com").insert()
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.02)
+
+
+def test_lease_holder_picks_up_jobs_inserted_elsewhere():
+    async def scenario():
+        await _init_jobs(range(1, 6))
+        sent = []
+
+        async def send_text(chat_id, text):
+            sent.append(chat_id)
+
+        watcher = asyncio.create_task(watch_jobs(send_text, source="web", interval=0.05))
+        # What /admin/broadcast does on a web worker under leader election.
+        job = BroadcastJob(text="hello", source="web")
+        await job.insert()
+
+        async def done():
+            current = await BroadcastJob.get(job.id)
+            return current.status == "done"
+
+        await _wait_for(done)
+        watcher.cancel()
+        await stop_jobs()
+        return sent
+
+    assert run(scenario()) == [1, 2, 3, 4, 5]
+
+
+def test_stop_jobs_hands_running_jobs_back():
+    async def scenario():
+        await _init_jobs(range(1, 51))
+        sent = []
+
+        async def send_text(chat_id, text):
+            await asyncio.sleep(0.01)
+            sent.append(chat_id)
+
+        job = BroadcastJob(text="hello", source="web")
+        await job.insert()
+        assert start_job(job, send_text)
+
+        async def started():
+            return bool(sent)
+
+        await _wait_for(started)
+        await stop_jobs()
+        return await BroadcastJob.get(job.id), len(sent)
+
+    job, sent = run(scenario())
+    # Still running and unowned: the next lease holder resumes it.
+    assert job.status == "running"
+    assert job.owner is None
+    assert 0 < sent < 50
+    assert job.last_telegram_id <= sent
+
+
+def test_failed_ids_are_capped(monkeypatch):
+    monkeypatch.setattr(broadcast, "FAILED_IDS_SAMPLE", 5)
+
+    async def scenario():
+        await _init_jobs(range(1, 21))
+
+        async def send_text(chat_id, text):
+            raise Forbidden("bot was blocked by the user")
+
+        job = BroadcastJob(text="hello", source="web")
+        await job.insert()
+        assert start_job(job, send_text)
+        await asyncio.gather(*list(broadcast._tasks.values()))
+        return await BroadcastJob.get(job.id)
+
+    job = run(scenario())
+    assert job.status == "done"
+    assert job.failed == 20
+    assert job.failed_ids == [1, 2, 3, 4, 5]
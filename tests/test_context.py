@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from beanie import init_beanie
+
+from app.context import UserLoader
+from app.models import User
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _user(telegram_id, name):
+    return User(telegram_id=telegram_id, full_name=name, phone="0", email="u@example.com")
+
+
+async def _init():
+    client = mongomock_motor.AsyncMongoMockClient()
+    await init_beanie(database=client["test"], document_models=[User])
+
+
+def test_prime_resolves_a_pending_load():
+    async def scenario():
+        await _init()
+        await _user(5, "stored").insert()
+        loader = UserLoader()
+        pending = loader.load(5)
+        # Primed before the batched fetch has run.
+        loader.prime(_user(5, "primed"))
+        first = await asyncio.wait_for(pending, timeout=1)
+        await asyncio.sleep(0.05)  # let the fetch finish
+        again = await loader.load(5)
+        return first, again
+
+    first, again = run(scenario())
+    assert first.full_name == "primed"
+    assert again is first
+
+
+def test_prime_replaces_a_finished_load():
+    async def scenario():
+        await _init()
+        await _user(6, "stored").insert()
+        loader = UserLoader()
+        stored = await loader.load(6)
+        loader.prime(_user(6, "primed"))
+        return stored, await loader.load(6), loader.round_trips
+
+    stored, primed, round_trips = run(scenario())
+    assert stored.full_name == "stored"
+    assert primed.full_name == "primed"
+    assert round_trips == 1
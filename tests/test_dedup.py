@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from beanie import init_beanie
+
+from app.dedup import UpdateDeduplicator
+from app.models import SeenUpdate
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _acceptor(results):
+    """accept() callables answering from ``results`` in call order, each
+    after a short delay so redeliveries overlap."""
+    calls = []
+
+    async def accept():
+        calls.append(len(calls))
+        await asyncio.sleep(0.02)
+        outcome = results[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return accept, calls
+
+
+def test_redelivery_during_failing_append_is_not_acknowledged():
+    async def scenario():
+        dedup = UpdateDeduplicator(use_mongo=False)
+        accept, calls = _acceptor([OSError("disk full"), True])
+        first = asyncio.create_task(dedup.accept(7, accept))
+        await asyncio.sleep(0.005)
+        redelivery = asyncio.create_task(dedup.accept(7, accept))
+        with pytest.raises(OSError):
+            await first
+        # Waited for the first delivery instead of answering 200 early.
+        assert await redelivery is False
+        assert len(calls) == 1
+        # Telegram's next retry is accepted, and later ones are dropped.
+        assert await dedup.accept(7, accept) is True
+        assert await dedup.accept(7, accept) is True
+        assert len(calls) == 2
+        assert dedup.dropped == 2
+
+    run(scenario())
+
+
+def test_rejected_update_is_retried_and_successful_one_dropped():
+    async def scenario():
+        dedup = UpdateDeduplicator(use_mongo=False)
+        accept, calls = _acceptor([False, True])
+        assert await dedup.accept(8, accept) is False
+        assert await dedup.accept(8, accept) is True
+        assert await dedup.accept(8, accept) is True
+        assert len(calls) == 2
+
+    run(scenario())
+
+
+def test_instances_share_claims_through_mongo():
+    async def scenario():
+        client = mongomock_motor.AsyncMongoMockClient()
+        await init_beanie(database=client["test"], document_models=[SeenUpdate])
+        a, b = UpdateDeduplicator(use_mongo=True), UpdateDeduplicator(use_mongo=True)
+        accept, calls = _acceptor([OSError("disk full"), True])
+        first = asyncio.create_task(a.accept(9, accept))
+        await asyncio.sleep(0.005)
+        # Instance b waits for a's claim, then takes over once it is released.
+        redelivery = asyncio.create_task(b.accept(9, accept))
+        with pytest.raises(OSError):
+            await first
+        assert await redelivery is True
+        assert len(calls) == 2
+        assert await a.accept(9, accept) is True
+        assert len(calls) == 2
+        doc = await SeenUpdate.find_one(SeenUpdate.update_id == 9)
+        assert doc.accepted
+
+    run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from beanie import init_beanie
+from pymongo.errors import DuplicateKeyError
+
+from app import enrollments
+from app.models import Enrollment, User
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _init():
+    client = mongomock_motor.AsyncMongoMockClient()
+    await init_beanie(database=client["test"], document_models=[User, Enrollment])
+    await User(telegram_id=1, full_name="Student", phone="", email="").insert()
+    await enrollments.invalidate_status(1)
+
+
+def test_concurrent_upserts_leave_one_enrollment():
+    async def scenario():
+        await _init()
+        # Bot submits a receipt while the web approves the same course.
+        # Smoke test: mongomock never interleaves the two upserts, so the
+        # DuplicateKeyError retry is forced in the next test.
+        await asyncio.gather(
+            enrollments.upsert_enrollment(1, "c1", "sham", "pending", "receipt-1"),
+            enrollments.upsert_enrollment(1, "c1", "haram", "approved"),
+        )
+        docs = await Enrollment.find(Enrollment.telegram_id == 1).to_list()
+        assert len(docs) == 1
+        assert docs[0].payment_receipt == "receipt-1"
+
+        student = await asyncio.gather(
+            enrollments.set_approval(1, "c1", "rejected"),
+            enrollments.set_approval(1, "c1", "approved"),
+        )
+        assert student[1] == {"telegram_id": 1, "full_name": "Student"}
+        docs = await Enrollment.find(Enrollment.telegram_id == 1).to_list()
+        assert len(docs) == 1
+        assert docs[0].approval_status == "approved"
+        assert docs[0].payment_receipt == "receipt-1"
+        assert await enrollments.enrollment_status(1, "c1") == "approved"
+
+    run(scenario())
+
+
+def test_upsert_retries_after_losing_the_insert_race(monkeypatch):
+    async def scenario():
+        await _init()
+        coll = Enrollment.get_motor_collection()
+        real_update_one = coll.update_one
+        calls = []
+
+        async def racing_update_one(key, update, upsert=False, **kwargs):
+            calls.append(upsert)
+            if upsert and len(calls) == 1:
+                # Another writer inserts the row between our match and insert.
+                await real_update_one(
+                    key, {"$set": {"payment_method": "haram", "approval_status": "approved"}}, upsert=True
+                )
+                raise DuplicateKeyError("E11000 duplicate key error", 11000)
+            return await real_update_one(key, update, upsert=upsert, **kwargs)
+
+        monkeypatch.setattr(coll, "update_one", racing_update_one)
+        assert await enrollments.enrollment_status(1, "c1") is None
+        await enrollments.upsert_enrollment(1, "c1", "sham", "pending", "receipt-1")
+        docs = await Enrollment.find(Enrollment.telegram_id == 1).to_list()
+        return calls, docs, await enrollments.enrollment_status(1, "c1")
+
+    calls, docs, status = run(scenario())
+    # The upsert failed once and was retried as a plain update.
+    assert calls == [True, False]
+    assert len(docs) == 1
+    assert (docs[0].payment_method, docs[0].approval_status, docs[0].payment_receipt) == ("sham", "pending", "receipt-1")
+    assert status == "pending"
+
+
+def test_set_approval_without_enrollment_returns_none():
+    async def scenario():
+        await _init()
+        assert await enrollments.set_approval(1, "missing", "approved") is None
+        assert await Enrollment.find_all().count() == 0
+
+    run(scenario())
@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+from telegram.ext import Application, DictPersistence
+
+from app import idle
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_sweep_persists_pending_changes_before_evicting():
+    async def scenario():
+        persistence = DictPersistence()
+        application = Application.builder().token("123:TEST").persistence(persistence).build()
+        idle._last_seen.clear()
+        application.user_data[1]["cart"] = ["year3_sem1_os"]
+        application.user_data[2]["cart"] = []
+        # Changed but not yet handed to persistence when the sweep runs.
+        application.mark_data_for_update_persistence(user_ids=[1, 2])
+        idle._last_seen[1] = time.monotonic() - 100
+        idle._last_seen[2] = time.monotonic()
+
+        dropped = await idle.sweep(application, ttl=10)
+        return dropped, application, persistence
+
+    dropped, application, persistence = run(scenario())
+    assert dropped == 1
+    assert 1 not in application.user_data
+    assert 2 in application.user_data
+    assert persistence.user_data[1] == {"cart": ["year3_sem1_os"]}
+    assert 1 not in idle._last_seen
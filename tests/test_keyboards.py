@@ -0,0 +1,66 @@
+import tracemalloc
+
+from app import keyboards
+from app.catalog import MATERIALS_BY_YEAR
+from app.loaders import get_courses, get_index
+
+TAPS = 1000
+
+
+def _navigation(cached: bool):
+    """One walk through the menus; ``cached=False`` calls the builders
+    directly, as every tap did before the cache."""
+    version = get_index().version
+    course_id = get_courses("professional")[0]["id"]
+    year, sems = next(iter(MATERIALS_BY_YEAR.items()))
+    sem = next(iter(sems))
+    selected = list(MATERIALS_BY_YEAR[year][sem][:1])
+
+    def build(fn, *args):
+        return fn(*args) if cached else fn.__wrapped__(*args)
+
+    if cached:
+        courses = [keyboards.get_courses_keyboard("professional")]
+        materials = [keyboards.materials_keyboard(year, sem, selected)]
+    else:
+        courses = [build(keyboards._courses_keyboard, version, "professional")]
+        materials = [build(keyboards._materials_keyboard, version, year, sem, frozenset(selected), len(selected))]
+    return courses + materials + [
+        build(keyboards.semesters_keyboard, year),
+        build(keyboards.course_details_keyboard, course_id),
+        build(keyboards.material_detail_keyboard, selected[0], year, sem),
+    ]
+
+
+def _allocated_per_tap(cached: bool):
+    _navigation(cached)  # warm the caches
+    kept = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(TAPS // 5):
+            # Kept alive, so the snapshot diff counts every markup built.
+            kept.extend(_navigation(cached))
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    return sum(d.size_diff for d in diff) / TAPS, sum(d.count_diff for d in diff) / TAPS
+
+
+def test_cached_keyboards_allocate_less_per_tap():
+    uncached_bytes, uncached_blocks = _allocated_per_tap(cached=False)
+    cached_bytes, cached_blocks = _allocated_per_tap(cached=True)
+    print(
+        f"per navigation tap: uncached {uncached_bytes:.0f} B / {uncached_blocks:.1f} blocks, "
+        f"cached {cached_bytes:.0f} B / {cached_blocks:.1f} blocks"
+    )
+    assert cached_bytes * 10 < uncached_bytes
+    assert cached_blocks * 10 < uncached_blocks
+
+
+def test_cache_is_keyed_by_catalog_version():
+    first = keyboards.get_courses_keyboard("professional")
+    assert keyboards.get_courses_keyboard("professional") is first
+    assert keyboards._courses_keyboard(get_index().version, "professional") is first
+    assert keyboards._courses_keyboard((0.0, 0.0), "professional") is not first
@@ -0,0 +1,44 @@
+import time
+from itertools import cycle, islice
+
+from app import loaders
+
+LOOKUPS = 10_000
+
+
+def _disk_lookup(course_id):
+    # The pre-index path: re-read both files and rebuild the lists per call.
+    data = loaders._read_json(loaders.COURSES_FILE) or {}
+    for course in loaders._build_professional_courses(data) + loaders._build_university_courses(data):
+        if course["id"] == course_id:
+            link = loaders._flatten_group_links(loaders._read_json(loaders.GROUP_LINKS_FILE) or {}).get(course_id)
+            return course, link
+    return None, None
+
+
+def _rate(lookup, ids):
+    start = time.perf_counter()
+    for course_id in ids:
+        lookup(course_id)
+    return len(ids) / (time.perf_counter() - start)
+
+
+def test_catalog_lookups_beat_the_disk_path():
+    loaders.reload_index(force=True)
+    index = loaders.get_index()
+    ids = list(index.courses)
+    assert ids
+
+    def indexed(course_id):
+        return loaders.get_course_by_id(course_id), loaders.get_group_link(course_id)
+
+    for course_id in ids:
+        course, _ = _disk_lookup(course_id)
+        if course is not None:
+            assert dict(indexed(course_id)[0]) == course
+
+    indexed_rate = _rate(indexed, list(islice(cycle(ids), LOOKUPS)))
+    disk_rate = _rate(_disk_lookup, list(islice(cycle(ids), 200)))
+    print(f"catalog lookups/s: index {indexed_rate:,.0f}, disk {disk_rate:,.0f}")
+    assert indexed_rate >= LOOKUPS
+    assert indexed_rate > 20 * disk_rate
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app import migrations
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def fast_heartbeat(monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATION_HEARTBEAT", 0.02)
+    monkeypatch.setattr(migrations, "MIGRATION_STALE", 0.2)
+
+
+def _counting_migration(calls, delay=0.1):
+    async def migrate():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return len(calls)
+
+    return migrate
+
+
+def test_concurrent_startups_run_the_migration_once():
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        calls = []
+        migrate = _counting_migration(calls)
+        await asyncio.gather(*(migrations.run_once(db, "dedupe_users", migrate) for _ in range(3)))
+        return calls, await db.migrations.find_one({"_id": "dedupe_users"})
+
+    calls, marker = run(scenario())
+    assert calls == [1]
+    assert marker["status"] == "done"
+    assert marker["result"] == 1
+
+
+def test_failed_run_releases_the_marker():
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await migrations.run_once(db, "dedupe_users", broken)
+        calls = []
+        await migrations.run_once(db, "dedupe_users", _counting_migration(calls, delay=0))
+        return calls
+
+    assert run(scenario()) == [1]
+
+
+def test_stalled_run_is_taken_over_and_legacy_markers_count_as_done():
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        stale = datetime.utcnow() - timedelta(seconds=5)
+        await db.migrations.insert_one(
+            {"_id": "dedupe_users", "status": "running", "owner": "dead", "started_at": stale, "heartbeat_at": stale}
+        )
+        await db.migrations.insert_one({"_id": "embedded_notifications", "done_at": stale, "result": 0})
+        calls = []
+        migrate = _counting_migration(calls, delay=0)
+        await migrations.run_once(db, "dedupe_users", migrate)
+        await migrations.run_once(db, "embedded_notifications", migrate)
+        return calls, await db.migrations.find_one({"_id": "dedupe_users"})
+
+    calls, marker = run(scenario())
+    assert calls == [1]
+    assert marker["status"] == "done"
+    assert marker["owner"] == migrations._OWNER
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+
+from windserve_app.storage import Storage
+
+RECORDS = 100_000
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _seed(store: Storage, count: int) -> None:
+    now = time.time()
+    with store._lock:
+        store._conn.execute("BEGIN")
+        store._conn.executemany(
+            "INSERT INTO messages (sid, message, created_at) VALUES (?, ?, ?)",
+            ((f"sid-{i % 1000}", f"message {i}", now) for i in range(count)),
+        )
+        store._conn.execute("COMMIT")
+
+
+def _json_append(path, entry) -> None:
+    # What every /contact request used to do with messages.json.
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    data.append(entry)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def test_append_latency_at_100k_records(tmp_path):
+    store = Storage(tmp_path / "windserve.db")
+    _seed(store, RECORDS)
+
+    async def appends(n):
+        latencies = []
+        for i in range(n):
+            start = time.perf_counter()
+            await store.add_message("sid-bench", f"append {i}")
+            latencies.append(time.perf_counter() - start)
+        return sorted(latencies)
+
+    latencies = run(appends(200))
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+
+    legacy = tmp_path / "messages.json"
+    legacy.write_text(json.dumps([{"sid": f"sid-{i % 1000}", "message": f"message {i}"} for i in range(RECORDS)]))
+    start = time.perf_counter()
+    _json_append(legacy, {"sid": "sid-bench", "message": "append"})
+    json_append = time.perf_counter() - start
+
+    print(f"append at {RECORDS} records: sqlite p99 {p99 * 1000:.2f} ms, json rewrite {json_append * 1000:.1f} ms")
+    assert p99 < json_append / 10
+    assert p99 < 0.05
+
+
+def test_listings_are_not_truncated(tmp_path):
+    store = Storage(tmp_path / "windserve.db")
+    _seed(store, 1200)
+
+    async def scenario():
+        for i in range(300):
+            await store.add_broadcast(f"title {i}", "body")
+        return await store.list_messages(), await store.list_broadcasts(), await store.list_messages(limit=10)
+
+    messages, broadcasts, page = run(scenario())
+    assert len(messages) == 1200
+    assert [b["title"] for b in broadcasts[:2]] == ["title 0", "title 1"]
+    assert len(broadcasts) == 300
+    assert len(page) == 10
+
+
+def test_set_proof_status(tmp_path):
+    store = Storage(tmp_path / "windserve.db")
+
+    async def scenario():
+        await store.add_proof({"id": "p1", "sid": "s1", "status": "pending"})
+        updated = await store.set_proof_status("s1", "p1", "approved")
+        missing = await store.set_proof_status("s1", "nope", "approved")
+        return updated, missing, await store.proofs_for_sid("s1")
+
+    updated, missing, proofs = run(scenario())
+    assert updated["id"] == "p1" and updated["status"] == "approved"
+    assert missing is None
+    assert [p["status"] for p in proofs] == ["approved"]
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from telegram.error import NetworkError, TimedOut
+
+from windserve_app import telegram_client as tg
+from windserve_app.main import app
+
+# Simulated Telegram round-trip.
+RTT = 0.05
+
+
+class FakeBot:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(RTT)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(chat_id)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def fake_bot(monkeypatch):
+    def install(**kwargs):
+        bot = FakeBot(**kwargs)
+        monkeypatch.setattr(tg, "_bot", bot)
+        # Semaphores bind to the loop that first waits on them.
+        monkeypatch.setattr(tg, "_slots", asyncio.Semaphore(tg.TG_HTTP_CONCURRENCY))
+        return bot
+
+    return install
+
+
+def test_requests_are_served_during_a_broadcast(fake_bot):
+    bot = fake_bot()
+
+    async def scenario():
+        # Sequential sends would take 200 * RTT = 10 s.
+        broadcast = asyncio.gather(*(tg.send_text(chat_id, "hi") for chat_id in range(200)))
+        latencies = []
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            while not broadcast.done():
+                start = time.perf_counter()
+                resp = await client.get("/api/health")
+                latencies.append(time.perf_counter() - start)
+                assert resp.status_code == 200
+                await asyncio.sleep(0.02)
+        await broadcast
+        return latencies
+
+    latencies = run(scenario())
+    assert len(bot.sent) == 200
+    assert len(latencies) >= 10
+    assert max(latencies) < 2 * RTT
+
+
+def test_send_is_not_retried_after_a_timeout(fake_bot):
+    bot = fake_bot(errors=[TimedOut()])
+    assert run(tg.send_message(1, "hi")) is False
+    assert bot.sent == []
+    assert not bot.errors
+
+
+def test_no_backoff_after_the_last_attempt(fake_bot, monkeypatch):
+    monkeypatch.setattr(tg, "TG_RETRY_DELAY", 0.05)
+    fake_bot(errors=[NetworkError("reset")] * tg.TG_MAX_ATTEMPTS)
+    start = time.perf_counter()
+    assert run(tg.send_message(1, "hi")) is False
+    elapsed = time.perf_counter() - start
+    # 3 attempts, 2 backoffs (0.1 + 0.2); a third backoff would add 0.4.
+    assert elapsed < 3 * RTT + 0.3 + 0.2
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.update_log import UpdateLog
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _payload(update_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": 1, "type": "private"}, "date": 0}}
+
+
+def test_incoming_process_waits_for_outgoing_to_close(tmp_path):
+    async def scenario():
+        outgoing = UpdateLog(str(tmp_path), fsync_interval=0)
+        assert await outgoing.open() == []
+        await outgoing.append(_payload(1))
+        await outgoing.append(_payload(2))
+
+        incoming = UpdateLog(str(tmp_path), fsync_interval=0)
+        opening = asyncio.create_task(incoming.open())
+        await asyncio.sleep(0.1)
+        # Still held: the incoming log must not replay or delete segments
+        # the outgoing one is writing to.
+        assert not opening.done()
+
+        outgoing.mark_done(1)
+        await outgoing.close()
+        unfinished = await asyncio.wait_for(opening, timeout=5)
+        assert [p["update_id"] for p in unfinished] == [2]
+        await incoming.close()
+
+    run(scenario())
+
+
+def test_lock_is_released_on_close(tmp_path):
+    async def scenario():
+        log = UpdateLog(str(tmp_path), fsync_interval=0)
+        await log.open()
+        await log.append(_payload(3))
+        await log.close()
+
+        reopened = UpdateLog(str(tmp_path), fsync_interval=0)
+        unfinished = await asyncio.wait_for(reopened.open(), timeout=1)
+        assert [p["update_id"] for p in unfinished] == [3]
+        await reopened.close()
+
+    run(scenario())
@@ -0,0 +1,119 @@
+import asyncio
+import random
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+
+telegram = pytest.importorskip("telegram")
+
+from telegram import Chat, Message, Update, User
+
+from app.update_processor import KeyedUpdateProcessor
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    return Update(
+        update_id,
+        message=Message(
+            update_id,
+            datetime.now(),
+            Chat(user_id, Chat.PRIVATE),
+            from_user=User(user_id, "student", False),
+        ),
+    )
+
+
+class _Log:
+    def __init__(self):
+        self.done = []
+
+    def mark_done(self, update_id: int) -> None:
+        self.done.append(update_id)
+
+
+def test_per_user_order_and_concurrency_bound():
+    limit = 3
+    users = [11, 22, 33, 44, 55]
+    per_user = 8
+
+    async def scenario():
+        log = _Log()
+        processor = KeyedUpdateProcessor(limit, update_log=log)
+        handled = defaultdict(list)
+        active = 0
+        peak = 0
+
+        async def handle(user_id: int, update_id: int):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(random.uniform(0, 0.005))
+            handled[user_id].append(update_id)
+            active -= 1
+
+        # Interleaved like a busy webhook: u1, u2, ..., u1, u2, ...
+        sent = defaultdict(list)
+        tasks = []
+        update_id = 0
+        for _ in range(per_user):
+            for user_id in users:
+                update_id += 1
+                sent[user_id].append(update_id)
+                tasks.append(
+                    asyncio.create_task(
+                        processor.process_update(_update(update_id, user_id), handle(user_id, update_id))
+                    )
+                )
+        await asyncio.gather(*tasks)
+        return sent, handled, peak, processor, log
+
+    random.seed(7)
+    sent, handled, peak, processor, log = asyncio.run(scenario())
+
+    assert handled == sent
+    assert 1 < peak <= limit
+    assert processor._locks == {}
+    assert sorted(log.done) == sorted(uid for ids in sent.values() for uid in ids)
+
+
+def test_p99_latency_with_200_concurrent_users():
+    users = 200
+    per_user = 5
+    limit = 32
+    work = 0.01  # simulated Mongo/Telegram round trip per update
+
+    async def scenario():
+        processor = KeyedUpdateProcessor(limit)
+        latencies = []
+        order = defaultdict(list)
+
+        async def handle(user_id: int, update_id: int, submitted: float):
+            await asyncio.sleep(work)
+            order[user_id].append(update_id)
+            latencies.append(asyncio.get_running_loop().time() - submitted)
+
+        loop = asyncio.get_running_loop()
+        tasks = []
+        update_id = 0
+        for _ in range(per_user):
+            for user_id in range(1, users + 1):
+                update_id += 1
+                tasks.append(
+                    asyncio.create_task(
+                        processor.process_update(
+                            _update(update_id, user_id), handle(user_id, update_id, loop.time())
+                        )
+                    )
+                )
+        await asyncio.gather(*tasks)
+        return sorted(latencies), order
+
+    latencies, order = asyncio.run(scenario())
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    sequential = users * per_user * work
+    print(f"p99 {p99 * 1000:.0f} ms for {users} users x {per_user} updates (sequential: {sequential:.1f} s)")
+    # All 1000 updates arrive at once; with 32 slots the burst drains in
+    # about users * per_user * work / limit seconds.
+    assert p99 < sequential / 5
+    assert all(ids == sorted(ids) for ids in order.values())
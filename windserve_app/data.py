@@ -1,141 +1,102 @@
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional
-
-
-# University materials hierarchy
-YEARS = [
-    {
-        "id": 3,
-        "name": "السنة الثالثة",
-        "semesters": {
-            1: [
-                {"id": "y3_s1_algo_ds", "name": "خوارزميات وبنى معطيات"},
-                {"id": "y3_s1_os1", "name": "نظم تشغيل 1"},
-                {"id": "y3_s1_computing", "name": "حوسبة"},
-            ],
-            2: [
-                {"id": "y3_s2_complexity", "name": "تعقيد"},
-                {"id": "y3_s2_ai_principles", "name": "مبادئ الذكاء"},
-                {"id": "y3_s2_se1", "name": "هندسة برمجيات 1"},
-                {"id": "y3_s2_comp_arch1", "name": "بنيان حواسيب 1"},
-            ],
-        },
-    },
-    {
-        "id": 4,
-        "name": "السنة الرابعة (ذكاء)",
-        "semesters": {
-            1: [
-                {"id": "y4_s1_multimedia", "name": "نظم وسائط متعددة"},
-                {"id": "y4_s1_concurrent", "name": "برمجة تفرعية"},
-                {"id": "y4_s1_nn", "name": "الشبكات العصبونية"},
-                {"id": "y4_s1_smart_search", "name": "خوارزميات بحث ذكية"},
-            ],
-            2: [
-                {"id": "y4_s2_compilers", "name": "بناء مترجمات"},
-                {"id": "y4_s2_cv", "name": "رؤية حاسوبية"},
-                {"id": "y4_s2_project", "name": "مشروع فصلي"},
-            ],
-        },
-    },
-    {
-        "id": 5,
-        "name": "السنة الخامسة",
-        "semesters": {
-            1: [
-                {"id": "y5_s1_prob_logic", "name": "منطق ترجيحي"},
-            ],
-            2: [
-                {"id": "y5_s2_nlp", "name": "معالجة اللغات الطبيعية"},
-                {"id": "y5_s2_kd", "name": "استكشاف معرفة"},
-                {"id": "y5_s2_rl", "name": "تعلم معزز"},
-            ],
-        },
-    },
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Mapping, Any, Tuple
+
+from app.catalog import MATERIALS_BY_YEAR, YEAR_NAMES
+from app.loaders import CatalogIndex, get_index
+
+
+# Shared template for material content
+MATERIAL_PROGRAM = [
+    "متابعة موادهم الجامعية بشكل منظّم خلال الفصل الدراسي.",
+    "عرض الملخصات لكل مادة.",
+    "اختبارات قصيرة بعد كل محاضرة.",
+    "تدريب عملي على أسئلة سابقة.",
+    "تقييم دوري لمستوى التقدم الأكاديمي لكل طالب.",
 ]
 
 
-def material_details(material_id: str) -> Dict:
-    # Shared template for material content
-    base = {
-        "teacher": "المهندسة شهد طراف",
-        "program": [
-            "متابعة موادهم الجامعية بشكل منظّم خلال الفصل الدراسي.",
-            "عرض الملخصات لكل مادة.",
-            "اختبارات قصيرة بعد كل محاضرة.",
-            "تدريب عملي على أسئلة سابقة.",
-            "تقييم دوري لمستوى التقدم الأكاديمي لكل طالب.",
-        ],
-        "price": 50000,
-    }
-    # Display name lookup from YEARS
-    for y in YEARS:
-        for sem, mats in y["semesters"].items():
-            for m in mats:
-                if m["id"] == material_id:
-                    return {
-                        "id": material_id,
-                        "name": m["name"],
-                        **base,
-                    }
+@dataclass(frozen=True)
+class WebCatalog:
+    """Web views of one catalog snapshot, compiled once per snapshot."""
+
+    years: List[Dict]
+    years_by_id: Dict[int, Dict]
+    courses: List[Dict]
+    courses_by_id: Dict[str, Dict]
+    materials: Dict[str, Dict]
+
+
+def _build(index: CatalogIndex) -> WebCatalog:
+    materials: Dict[str, Dict] = {}
+    years: List[Dict] = []
+    for year_id, semesters in MATERIALS_BY_YEAR.items():
+        year = {"id": year_id, "name": YEAR_NAMES.get(year_id, str(year_id)), "semesters": {}}
+        for sem, mids in semesters.items():
+            year["semesters"][sem] = [
+                {"id": mid, "name": index.courses[mid]["name"]} for mid in mids if mid in index.courses
+            ]
+            for mid in mids:
+                m = index.courses.get(mid)
+                if not m:
+                    continue
+                materials[mid] = {
+                    "id": mid,
+                    "name": m["name"],
+                    "teacher": m.get("instructor") or "المهندسة شهد طراف",
+                    "program": MATERIAL_PROGRAM,
+                    "price": m.get("price") or 50000,
+                }
+        years.append(year)
+
+    courses = [dict(c) for c in index.categories.get("professional", ())]
+    return WebCatalog(
+        years=years,
+        years_by_id={y["id"]: y for y in years},
+        courses=courses,
+        courses_by_id={c["id"]: c for c in courses},
+        materials=materials,
+    )
+
+
+_compiled: Optional[Tuple[CatalogIndex, WebCatalog]] = None
+
+
+def _web() -> WebCatalog:
+    global _compiled
+    index = get_index()
+    compiled = _compiled
+    if compiled is None or compiled[0] is not index:
+        compiled = (index, _build(index))
+        _compiled = compiled
+    return compiled[1]
+
+
+def get_years() -> List[Dict]:
+    return _web().years
+
+
+def get_year(year_id: int) -> Optional[Dict]:
+    return _web().years_by_id.get(year_id)
+
+
+def material_details(material_id: str) -> Mapping[str, Any]:
+    web = _web()
+    details = web.materials.get(get_index().resolve(material_id))
+    if details:
+        return details
     # fallback
     return {
         "id": material_id,
         "name": material_id,
-        **base,
+        "teacher": "المهندسة شهد طراف",
+        "program": MATERIAL_PROGRAM,
+        "price": 50000,
     }
 
 
-# Professional courses
-COURSES = [
-    {
-        "id": "nlp_beginner",
-        "name": "معالجة اللغات الطبيعية - مبتدئ",
-        "duration": "6 أشهر",
-        "price": 75000,
-        "content": [
-            "أساسيات الرياضيات",
-            "Python",
-            "تعلم الآلة (Machine Learning)",
-            "التعلم العميق (Deep Learning)",
-            "معالجة اللغات الطبيعية (NLP)",
-        ],
-        "projects": [
-            "نظام توصيات أفلام",
-            "تحليل المشاعر",
-            "تصميم شات بوت ذكي",
-        ],
-    },
-    {
-        "id": "nlp_intermediate",
-        "name": "معالجة اللغات الطبيعية - متوسط",
-        "duration": "3 أشهر",
-        "price": 75000,
-        "content": [
-            "تعلم الآلة (Machine Learning)",
-            "التعلم العميق (Deep Learning)",
-            "معالجة اللغات الطبيعية (NLP)",
-        ],
-        "projects": [
-            "نظام توصيات أفلام",
-            "تحليل المشاعر",
-            "تصميم شات بوت ذكي",
-        ],
-    },
-    {
-        "id": "nlp_expert",
-        "name": "معالجة اللغات الطبيعية - خبير",
-        "duration": "شهر",
-        "price": 75000,
-        "content": [
-            "تطبيقات متقدمة في NLP",
-        ],
-        "projects": [
-            "تصميم شات بوت ذكي قادر على التفاعل مع المستخدم",
-        ],
-    },
-]
+def get_courses() -> List[Dict]:
+    return _web().courses
 
 
 def get_course(cid: str) -> Optional[Dict]:
-    return next((c for c in COURSES if c["id"] == cid), None)
+    return _web().courses_by_id.get(cid)
@@ -0,0 +1,217 @@
+"""SQLite (WAL) store for web-site messages, broadcasts and payment proofs.
+
+Replaces messages.json / broadcast.json / proofs.json, which were read and
+rewritten in full on every request. Each write is now one small indexed
+transaction; WAL lets readers proceed while a write commits, and a crash
+mid-write can no longer corrupt the history.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sid TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_sid ON messages (sid);
+
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS proofs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    sid TEXT NOT NULL,
+    item_type TEXT,
+    item_id TEXT,
+    file TEXT,
+    payment_method TEXT,
+    telegram_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS proofs_sid ON proofs (sid);
+CREATE INDEX IF NOT EXISTS proofs_status ON proofs (status);
+
+CREATE TABLE IF NOT EXISTS json_imports (
+    name TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL
+);
+"""
+
+_PROOF_FIELDS = ("id", "sid", "item_type", "item_id", "file", "payment_method", "telegram_id", "status")
+
+
+class Storage:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    # ---------- sync core (runs in a worker thread) ----------
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _read(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(sql, params).fetchall()]
+
+    def migrate_json(self, storage_dir: Path) -> int:
+        """One-shot import of the legacy JSON files. Each import is recorded
+        in json_imports in the same transaction, and the file is renamed to
+        *.migrated only after the commit, so a crash at any point neither
+        loses the data nor imports it twice."""
+        files = {name: storage_dir / name for name in ("messages.json", "broadcast.json", "proofs.json")}
+        if not any(p.exists() for p in files.values()):
+            return 0
+        imported = 0
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE serializes concurrent workers doing the same import.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = {r["name"] for r in self._conn.execute("SELECT name FROM json_imports")}
+                pending = {name: p for name, p in files.items() if name not in done and p.exists()}
+                if "messages.json" in pending:
+                    for m in _load(files["messages.json"]) or []:
+                        self._conn.execute(
+                            "INSERT INTO messages (sid, message, created_at) VALUES (?, ?, ?)",
+                            (m.get("sid") or "", m.get("message") or "", now),
+                        )
+                        imported += 1
+                if "broadcast.json" in pending:
+                    for b in _load(files["broadcast.json"]) or []:
+                        self._conn.execute(
+                            "INSERT INTO broadcasts (title, body, created_at) VALUES (?, ?, ?)",
+                            (b.get("title") or "", b.get("body") or "", now),
+                        )
+                        imported += 1
+                if "proofs.json" in pending:
+                    for sid, entries in (_load(files["proofs.json"]) or {}).items():
+                        for e in entries:
+                            self._conn.execute(
+                                "INSERT OR IGNORE INTO proofs (id, sid, item_type, item_id, file, payment_method,"
+                                " telegram_id, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (
+                                    e.get("id"), sid, e.get("item_type"), e.get("item_id"), e.get("file"),
+                                    e.get("payment_method"), e.get("telegram_id"), e.get("status") or "pending", now,
+                                ),
+                            )
+                            imported += 1
+                self._conn.executemany(
+                    "INSERT INTO json_imports (name, imported_at) VALUES (?, ?)", [(name, now) for name in pending]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        for p in files.values():
+            try:
+                p.rename(p.with_name(p.name + ".migrated"))
+            except FileNotFoundError:
+                pass  # absent, or renamed by a concurrent worker
+        return imported
+
+    # ---------- async API ----------
+    async def add_message(self, sid: str, message: str) -> None:
+        await asyncio.to_thread(
+            self._write, "INSERT INTO messages (sid, message, created_at) VALUES (?, ?, ?)", (sid, message, time.time())
+        )
+
+    # ``limit=None`` lists everything, as the JSON files did; SQLite reads a
+    # negative LIMIT as no limit.
+    async def list_messages(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._read, "SELECT * FROM messages ORDER BY id DESC LIMIT ?", (_limit(limit),))
+
+    async def add_broadcast(self, title: str, body: str) -> None:
+        await asyncio.to_thread(
+            self._write, "INSERT INTO broadcasts (title, body, created_at) VALUES (?, ?, ?)", (title, body, time.time())
+        )
+
+    async def list_broadcasts(self, newest_first: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._read, "SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?", (_limit(limit),)
+        )
+        return rows if newest_first else list(reversed(rows))
+
+    async def add_proof(self, entry: Dict[str, Any]) -> None:
+        values = tuple(entry.get(f) for f in _PROOF_FIELDS) + (time.time(),)
+        await asyncio.to_thread(
+            self._write,
+            f"INSERT INTO proofs ({', '.join(_PROOF_FIELDS)}, created_at) VALUES ({', '.join('?' * (len(_PROOF_FIELDS) + 1))})",
+            values,
+        )
+
+    async def proofs_for_sid(self, sid: Optional[str]) -> List[Dict[str, Any]]:
+        if not sid:
+            return []
+        return await asyncio.to_thread(self._read, "SELECT * FROM proofs WHERE sid = ? ORDER BY seq", (sid,))
+
+    async def list_proofs(self, status: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if status:
+            sql, params = "SELECT * FROM proofs WHERE status = ? ORDER BY seq DESC LIMIT ?", (status, _limit(limit))
+        else:
+            sql, params = "SELECT * FROM proofs ORDER BY seq DESC LIMIT ?", (_limit(limit),)
+        return await asyncio.to_thread(self._read, sql, params)
+
+    async def set_proof_status(self, sid: str, pid: str, status: str) -> Optional[Dict[str, Any]]:
+        """Atomically update one proof; returns it, or None if it does not exist."""
+
+        def update():
+            # UPDATE then SELECT in one transaction (RETURNING needs SQLite 3.35).
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    cur = self._conn.execute("UPDATE proofs SET status = ? WHERE sid = ? AND id = ?", (status, sid, pid))
+                    row = None
+                    if cur.rowcount:
+                        row = self._conn.execute("SELECT * FROM proofs WHERE sid = ? AND id = ?", (sid, pid)).fetchone()
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                return dict(row) if row else None
+
+        return await asyncio.to_thread(update)
+
+
+_instance: Optional[Storage] = None
+_instance_lock = threading.Lock()
+
+
+def open_storage(storage_dir: Path) -> Storage:
+    """Process-wide store, created (and the JSON import run) on first use."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                storage_dir.mkdir(parents=True, exist_ok=True)
+                store = Storage(storage_dir / "windserve.db")
+                store.migrate_json(storage_dir)
+                _instance = store
+    return _instance
+
+
+def _limit(limit: Optional[int]) -> int:
+    return -1 if limit is None else limit
+
+
+def _load(path: Path) -> Any:
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,131 @@
+"""Async Telegram client for the web app.
+
+One pooled keep-alive PTB ``Bot`` per process replaces the blocking
+``requests.post`` calls, so a slow Telegram round-trip never stalls the
+event loop that also serves pages (and, in main.py, the webhook bot).
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
+
+TG_HTTP_CONCURRENCY = int(os.getenv("TG_HTTP_CONCURRENCY", "8"))
+TG_HTTP_TIMEOUT = float(os.getenv("TG_HTTP_TIMEOUT", "10"))
+TG_MAX_ATTEMPTS = 3
+TG_RETRY_DELAY = 0.5
+
+logger = logging.getLogger(__name__)
+
+_bot: Optional[Bot] = None
+_init_lock = asyncio.Lock()
+_slots = asyncio.Semaphore(TG_HTTP_CONCURRENCY)
+
+
+async def get_bot() -> Optional[Bot]:
+    global _bot
+    if _bot is not None:
+        return _bot
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        return None
+    async with _init_lock:
+        if _bot is None:
+            request = HTTPXRequest(
+                connection_pool_size=TG_HTTP_CONCURRENCY,
+                connect_timeout=TG_HTTP_TIMEOUT,
+                read_timeout=TG_HTTP_TIMEOUT,
+                write_timeout=TG_HTTP_TIMEOUT,
+                pool_timeout=TG_HTTP_TIMEOUT,
+            )
+            bot = Bot(token, request=request)
+            await bot.initialize()
+            _bot = bot
+    return _bot
+
+
+async def _bot_or_none() -> Optional[Bot]:
+    try:
+        return await get_bot()
+    except Exception:
+        logger.exception("Telegram client initialization failed")
+        return None
+
+
+async def close() -> None:
+    global _bot
+    bot, _bot = _bot, None
+    if bot is not None:
+        await bot.shutdown()
+
+
+async def send_text(chat_id: int, text: str) -> None:
+    """Single attempt, errors propagate (the broadcast engine owns retries)."""
+    bot = await get_bot()
+    if bot is None:
+        raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
+    async with _slots:
+        await bot.send_message(chat_id=chat_id, text=text)
+
+
+async def _with_retry(call, what: str) -> bool:
+    """Every call here sends something, so it is not retried after a
+    timeout: Telegram may have delivered it, and a retry would duplicate it."""
+    for attempt in range(1, TG_MAX_ATTEMPTS + 1):
+        try:
+            async with _slots:
+                await call()
+            return True
+        except RetryAfter as e:
+            delay = float(e.retry_after)
+        except (BadRequest, Forbidden) as e:
+            logger.warning("Telegram %s rejected: %s", what, e)
+            return False
+        except TimedOut:
+            logger.warning("Telegram %s timed out; not retrying", what)
+            return False
+        except NetworkError:
+            delay = TG_RETRY_DELAY * 2 ** attempt
+        except Exception:
+            logger.exception("Telegram %s failed", what)
+            return False
+        if attempt < TG_MAX_ATTEMPTS:
+            await asyncio.sleep(delay)
+    logger.warning("Telegram %s gave up after %s attempts", what, TG_MAX_ATTEMPTS)
+    return False
+
+
+async def send_message(chat_id: int, text: str) -> bool:
+    """Best-effort notification with retry/backoff; never raises."""
+    bot = await _bot_or_none()
+    if bot is None or not chat_id:
+        return False
+    return await _with_retry(lambda: bot.send_message(chat_id=chat_id, text=text), "sendMessage")
+
+
+async def _send_file_to_admin(file_path: Path, caption: str, as_photo: bool) -> bool:
+    bot = await _bot_or_none()
+    admin_id = os.getenv("TELEGRAM_ADMIN_ID")
+    if bot is None or not admin_id:
+        return False
+
+    async def call():
+        with file_path.open("rb") as fp:
+            if as_photo:
+                await bot.send_photo(chat_id=int(admin_id), photo=fp, caption=caption)
+            else:
+                await bot.send_document(chat_id=int(admin_id), document=fp, caption=caption)
+
+    return await _with_retry(call, "sendPhoto" if as_photo else "sendDocument")
+
+
+async def send_photo_to_admin(file_path: Path, caption: str) -> bool:
+    return await _send_file_to_admin(file_path, caption, as_photo=True)
+
+
+async def send_document_to_admin(file_path: Path, caption: str) -> bool:
+    return await _send_file_to_admin(file_path, caption, as_photo=False)
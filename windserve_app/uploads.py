@@ -0,0 +1,94 @@
+"""Streaming, content-addressed storage for payment-proof uploads.
+
+The upload is copied to disk in fixed-size chunks and hashed on the way,
+so memory use per request stays at one chunk whatever the file size. The
+SHA-256 names the stored file (``proofs/ab/abcd....jpg``), which means an
+identical receipt uploaded twice is kept on disk only once.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+
+# Sniffed from the first bytes; the client's Content-Type is only used to
+# reject obviously wrong files before anything is written.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"%PDF-", "application/pdf", ".pdf"),
+)
+ALLOWED_TYPES = {mime for _, mime, _ in _SIGNATURES} | {"image/webp", "image/jpg"}
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    path: Path
+    sha256: str
+    size: int
+    content_type: str
+
+    @property
+    def is_image(self) -> bool:
+        return self.content_type.startswith("image/")
+
+
+def _sniff(head: bytes) -> Optional[tuple]:
+    for magic, mime, ext in _SIGNATURES:
+        if head.startswith(magic):
+            return mime, ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    return None
+
+
+async def save_upload(file: UploadFile, root: Path, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredUpload:
+    """Stream ``file`` under ``root/proofs``; raises HTTPException 413/415."""
+    declared = (file.content_type or "").split(";")[0].strip().lower()
+    if declared and declared != "application/octet-stream" and declared not in ALLOWED_TYPES:
+        raise HTTPException(status_code=415, detail="Only JPEG, PNG, WEBP or PDF receipts are accepted")
+
+    tmp_dir = root / ".incoming"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / uuid.uuid4().hex
+    digest = hashlib.sha256()
+    size = 0
+    kind = None
+    try:
+        with tmp.open("wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if kind is None:
+                    kind = _sniff(chunk)
+                    if kind is None:
+                        raise HTTPException(status_code=415, detail="Only JPEG, PNG, WEBP or PDF receipts are accepted")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+        if kind is None:
+            raise HTTPException(status_code=400, detail="Empty file")
+        sha = digest.hexdigest()
+        mime, ext = kind
+        target = root / "proofs" / sha[:2] / f"{sha}{ext}"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            tmp.unlink()
+        else:
+            os.replace(tmp, target)
+        return StoredUpload(path=target, sha256=sha, size=size, content_type=mime)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        await file.close()